@@ -0,0 +1,224 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+from emulator import ShellEmulator
+
+try:
+    import resource  # Только для Unix-подобных ОС
+except ImportError:
+    resource = None
+
+
+class RepeatedData(io.RawIOBase):
+    """Поток заданной длины из повторяющегося блока: большие файлы не держатся в памяти."""
+
+    def __init__(self, size, block=b"benchmark line of a large synthetic file\n"):
+        self._remaining = size
+        self._block = block * (64 * 1024 // len(block) + 1)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining, len(self._block))
+        buffer[:count] = self._block[:count]
+        self._remaining -= count
+        return count
+
+
+def shape_deep(scale):
+    # Цепочка вложенных каталогов с несколькими файлами на каждом уровне
+    depth = max(2, int(200 * scale))
+    files = []
+    path = "."
+    for level in range(depth):
+        path = f"{path}/level{level}"
+        files.extend((f"{path}/file{i}.txt", 256) for i in range(3))
+    return files
+
+
+def shape_wide(scale):
+    # Несколько каталогов с очень большим числом файлов
+    count = max(10, int(20000 * scale))
+    return [(f"./wide{i % 4}/file{i}.txt", 128) for i in range(count)]
+
+
+def shape_large(scale):
+    # Несколько больших файлов
+    size = max(64 * 1024, int(64 * 1024 * 1024 * scale))
+    return [(f"./large/file{i}.log", size) for i in range(4)]
+
+
+SHAPES = {
+    "deep": shape_deep,
+    "wide": shape_wide,
+    "large": shape_large,
+}
+
+
+def generate_archive(path, files, compression):
+    # Синтетический архив нужной формы; compression: none, gz, xz или bz2
+    mode = "w" if compression == "none" else f"w:{compression}"
+    with tarfile.open(path, mode) as tar:
+        for name, size in files:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = 1700000000
+            tar.addfile(info, io.BufferedReader(RepeatedData(size)))
+    return os.path.getsize(path)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    return {
+        "count": len(samples),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": samples[-1],
+    }
+
+
+def measure_load(archive_path, index_path):
+    """Время загрузки без индекса-спутника и с ним, а также память под дерево."""
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    shell = ShellEmulator(archive_path, "bench", index_path=index_path)
+    cold = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    shell.close()
+
+    started = time.perf_counter()
+    shell = ShellEmulator(archive_path, "bench", index_path=index_path)
+    warm = time.perf_counter() - started
+    return shell, {
+        "cold_seconds": cold,
+        "warm_seconds": warm,
+        "index_bytes": current,
+        "peak_bytes": peak,
+    }
+
+
+def measure_latency(shell, files, repeat, rng):
+    """Перцентили задержки команд на случайных путях архива."""
+    paths = [name[1:] for name, _ in files]  # './dir/file' -> '/dir/file'
+    directories = sorted({path.rsplit("/", 1)[0] or "/" for path in paths})
+    samples = {name: [] for name in ("ls", "cd", "cat", "head", "mv")}
+
+    def timed(command, action):
+        started = time.perf_counter()
+        action()
+        samples[command].append(time.perf_counter() - started)
+
+    for _ in range(repeat):
+        directory = rng.choice(directories)
+        path = rng.choice(paths)
+        timed("cd", lambda: shell.cd(directory))
+        timed("ls", shell.ls)
+        shell.cd("/")
+        timed("head", lambda: shell.head(path))
+        timed("cat", lambda: shell.cat(path))
+        # Переименование туда и обратно, чтобы дерево не менялось между повторами
+        timed("mv", lambda: shell.mv(path, path + ".moved"))
+        shell.mv(path + ".moved", path)
+
+    return {command: percentiles(values) for command, values in samples.items()}
+
+
+def run_benchmark(shapes, compressions, scale=1.0, repeat=100, seed=0, workdir=None):
+    """
+    Генерирует архивы и измеряет загрузку, память и задержку команд.
+
+    :return: Отчёт в виде словаря, пригодный для json.dump
+    """
+    rng = random.Random(seed)
+    own_workdir = workdir is None
+    workdir = tempfile.mkdtemp(prefix="emulator-bench-") if own_workdir else workdir
+    results = []
+    try:
+        for shape in shapes:
+            files = SHAPES[shape](scale)
+            for compression in compressions:
+                suffix = "" if compression == "none" else f".{compression}"
+                archive_path = os.path.join(workdir, f"{shape}.tar{suffix}")
+                archive_bytes = generate_archive(archive_path, files, compression)
+
+                shell, load = measure_load(archive_path, archive_path + ".idx")
+                # Вывод команд не нужен, важна только задержка
+                with open(os.devnull, "w", encoding="utf-8") as devnull:
+                    shell.out = devnull
+                    try:
+                        latency = measure_latency(shell, files, repeat, rng)
+                    finally:
+                        shell.close()
+
+                results.append({
+                    "shape": shape,
+                    "compression": compression,
+                    "members": len(files),
+                    "archive_bytes": archive_bytes,
+                    "load": load,
+                    "latency": latency,
+                })
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scale": scale,
+        "repeat": repeat,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "results": results,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк эмулятора оболочки на синтетических архивах")
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES),
+                        help="Формы архивов для генерации")
+    parser.add_argument('--compression', nargs='+', choices=["none", "gz", "xz", "bz2"], default=["none", "gz"],
+                        help="Варианты сжатия архивов")
+    parser.add_argument('--scale', type=float, default=1.0, help="Множитель размера архивов (по умолчанию 1.0)")
+    parser.add_argument('--repeat', type=int, default=100, help="Число повторов каждой команды")
+    parser.add_argument('--seed', type=int, default=0, help="Зерно генератора случайных путей")
+    parser.add_argument('-o', '--output', default="benchmark.json", help="Файл для JSON-результатов")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = run_benchmark(args.shapes, args.compression, args.scale, args.repeat, args.seed)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+    for result in report["results"]:
+        latency = ", ".join(f"{command} p50={values['p50'] * 1e6:.0f}us"
+                            for command, values in result["latency"].items())
+        print(f"{result['shape']:>6} {result['compression']:>4}: {result['members']} members, "
+              f"load {result['load']['cold_seconds']:.3f}s cold / {result['load']['warm_seconds']:.3f}s warm, "
+              f"{latency}")
+    print(f"Результаты сохранены в '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,932 @@
+import argparse
+import asyncio
+import bisect
+import bz2
+import fnmatch
+import io
+import lzma
+import mmap
 import os
+import re
+import struct
+import sys
 import tarfile
+import tempfile
+import threading
+import time
+import zlib
 import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 try:
     import readline  # Для Unix-подобных ОС
 except ImportError:
     import pyreadline as readline  # Для Windows
 
+try:
+    import zstandard  # Необязательно: нужен только для архивов .tar.zst
+except ImportError:
+    zstandard = None
+
+
+class Entry:
+    """
+    Компактная запись о члене архива.
+
+    Хранит только то, что нужно оболочке, вместо полного TarInfo с pax-заголовками,
+    uname/gname и прочим: миллионы записей должны помещаться в памяти.
+    """
+
+    __slots__ = ("name", "type", "size", "offset_data", "mode", "mtime")
+
+    def __init__(self, name, type=tarfile.REGTYPE, size=0, offset_data=0, mode=0o644, mtime=0):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.offset_data = offset_data
+        self.mode = mode
+        self.mtime = mtime
+
+    def isfile(self):
+        return self.type in tarfile.REGULAR_TYPES
+
+    def isdir(self):
+        return self.type == tarfile.DIRTYPE
+
+    def issparse(self):
+        return False
+
+    def update(self, info):
+        # Поля явной записи каталога заменяют значения неявно созданного
+        self.type = info.type
+        self.size = info.size
+        self.offset_data = info.offset_data
+        self.mode = info.mode
+        self.mtime = info.mtime
+
+
+class Node(Entry):
+    """
+    Узел дерева виртуальной файловой системы.
+
+    Сам является записью архива; name — только последний компонент пути,
+    интернированный, чтобы одинаковые имена в разных каталогах не дублировались.
+    """
+
+    __slots__ = ("children", "archive")
+
+    def __init__(self, name, type=tarfile.REGTYPE, size=0, offset_data=0, mode=0o644, mtime=0,
+                 children=None, archive=None):
+        super().__init__(name, type, size, offset_data, mode, mtime)
+        self.children = children  # Словарь имя -> Node для каталога, None для файла
+        self.archive = archive  # Архив, из которого читаются данные файла
+
+    @classmethod
+    def from_info(cls, name, info, archive=None):
+        # Разрежённому члену для чтения нужна карта фрагментов из полного TarInfo
+        if info.issparse():
+            return SparseNode(name, info, archive)
+        return cls(name, info.type, info.size, info.offset_data, info.mode, info.mtime,
+                   {} if info.isdir() else None, archive)
+
+    @property
+    def info(self):
+        return self
+
+    def isdir(self):
+        return self.children is not None
+
+    def child(self, name):
+        return self.children.get(name)
+
+    def items(self):
+        return self.children.items()
+
+    def set_child(self, name, node):
+        self.children[name] = node
+
+    def remove_child(self, name):
+        del self.children[name]
+
+
+class SparseNode(Node):
+    """Узел разрежённого члена: сохраняет исходный TarInfo для сборки фрагментов."""
+
+    __slots__ = ("tarinfo",)
+
+    def __init__(self, name, tarinfo, archive=None):
+        super().__init__(name, tarinfo.type, tarinfo.size, tarinfo.offset_data, tarinfo.mode, tarinfo.mtime,
+                         None, archive)
+        self.tarinfo = tarinfo
+
+    @property
+    def info(self):
+        return self.tarinfo
+
+
+class FileTree:
+    """
+    Дерево каталогов, построенное по членам tar-архива.
+
+    Поиск по пути стоит O(глубина пути), а не O(число записей архива).
+    Пути принимаются в любом из видов './dir/file', '/dir/file' или 'dir/file'.
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive
+        self.root = self._dir_node(".")
+
+    @staticmethod
+    def split(path):
+        # Разбиваем путь на компоненты, отбрасывая пустые части и "."
+        return [part for part in path.replace("\\", "/").split("/") if part not in ("", ".")]
+
+    @staticmethod
+    def _dir_info(parts):
+        # Запись для каталога, которого нет в архиве явно
+        return Entry(parts[-1] if parts else ".", tarfile.DIRTYPE, mode=0o755)
+
+    def _dir_node(self, name):
+        return Node(sys.intern(name), tarfile.DIRTYPE, mode=0o755, children={}, archive=self.archive)
+
+    def add(self, info):
+        # Добавляем запись архива, создавая недостающие родительские каталоги
+        parts = self.split(info.name)
+        if not parts:
+            self.root.update(info)
+            return
+        parent = self.make_dirs(parts[:-1])
+        if parent is None:
+            return
+        name = sys.intern(parts[-1])
+        node = parent.child(name)
+        if info.isdir() and node is not None and node.isdir():
+            # Каталог мог быть создан неявно раньше своей записи в архиве
+            node.update(info)
+        else:
+            parent.set_child(name, Node.from_info(name, info, self.archive))
+
+    def make_dirs(self, parts):
+        # Аналог mkdir -p: возвращает узел каталога или None, если путь занят файлом
+        node = self.root
+        for part in parts:
+            child = node.child(part)
+            if child is None:
+                child = self._dir_node(part)
+                node.set_child(child.name, child)
+            elif not child.isdir():
+                return None
+            node = child
+        return node
+
+    def lookup(self, path):
+        parts = self.split(path) if isinstance(path, str) else path
+        node = self.root
+        for part in parts:
+            if not node.isdir():
+                return None
+            node = node.child(part)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, path):
+        return self.lookup(path) is not None
+
+    def __getitem__(self, path):
+        node = self.lookup(path)
+        if node is None:
+            raise KeyError(path)
+        return node.info
+
+    @staticmethod
+    def join(path, name):
+        return f"{path.rstrip('/')}/{name}"
+
+    def walk(self, node, path):
+        # Обход поддерева в глубину без рекурсии; дети выдаются в алфавитном порядке
+        stack = [(path, node)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            if node.isdir():
+                for name, child in sorted(node.items(), key=lambda item: item[0], reverse=True):
+                    stack.append((self.join(path, name), child))
+
+    def __iter__(self):
+        # Обход всех путей дерева (без рекурсии), имена в формате архива './dir/file'
+        stack = [(".", self.root)]
+        while stack:
+            path, node = stack.pop()
+            yield path
+            if node.isdir():
+                for name, child in node.items():
+                    stack.append((f"{path}/{name}", child))
+
+
+class OverlayDir:
+    """Каталог слоя изменений: каталог базового дерева и отличия от него."""
+
+    def __init__(self, info, base=None):
+        self.info = info
+        self.base = base  # Node базового дерева или None для нового каталога
+        self.changes = {}  # Имя -> узел; None закрывает имя базового каталога
+
+    def isdir(self):
+        return True
+
+    def child(self, name):
+        if name in self.changes:
+            return self.changes[name]
+        return self.base.child(name) if self.base is not None else None
+
+    def items(self):
+        if self.base is not None:
+            for name, node in self.base.items():
+                if name not in self.changes:
+                    yield name, node
+        for name, node in self.changes.items():
+            if node is not None:
+                yield name, node
+
+    def set_child(self, name, node):
+        self.changes[name] = node
+
+    def remove_child(self, name):
+        if self.base is not None and self.base.child(name) is not None:
+            self.changes[name] = None
+        else:
+            self.changes.pop(name, None)
+
+
+class OverlayFile(Node):
+    """Файл, созданный в слое изменений; содержимое хранится в памяти."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, name, data):
+        super().__init__(name, tarfile.REGTYPE, len(data), mtime=time.time())
+        self.data = data
+
+
+class Overlay(FileTree):
+    """
+    Слой изменений поверх неизменяемого дерева архива (копирование при записи).
+
+    Базовое дерево не меняется: изменённые каталоги заменяются обёртками OverlayDir
+    только вдоль затронутых путей, поэтому переименование каталога любого размера
+    стоит O(глубина путей). Все операции записываются в журнал, который можно
+    сохранить как небольшой архив изменений и применить повторно.
+    """
+
+    MANIFEST_NAME = ".overlay.json"
+
+    def __init__(self, base):
+        self.base = base
+        self.root = OverlayDir(base.root.info, base.root)
+        self.journal = []
+
+    def make_dirs(self, parts):
+        # Каталоги базового дерева на пути оборачиваются, а не изменяются
+        node = self.root
+        for i, part in enumerate(parts):
+            child = node.child(part)
+            if child is None:
+                child = OverlayDir(self._dir_info(parts[:i + 1]))
+                node.set_child(part, child)
+            elif not child.isdir():
+                return None
+            elif not isinstance(child, OverlayDir):
+                child = OverlayDir(child.info, child)
+                node.set_child(part, child)
+            node = child
+        return node
+
+    def mkdir(self, parts):
+        parent = self.make_dirs(parts[:-1])
+        parent.set_child(parts[-1], OverlayDir(self._dir_info(parts)))
+        self.journal.append(("mkdir", "/" + "/".join(parts)))
+
+    def move(self, src_parts, dst_parts):
+        # Узел переносится целиком вместе с поддеревом; False, если путь назначения занят файлом
+        dst_parent = self.make_dirs(dst_parts[:-1])
+        if dst_parent is None:
+            return False
+        src_parent = self.make_dirs(src_parts[:-1])
+        node = src_parent.child(src_parts[-1])
+        src_parent.remove_child(src_parts[-1])
+        dst_parent.set_child(dst_parts[-1], node)
+        self.journal.append(("move", "/" + "/".join(src_parts), "/" + "/".join(dst_parts)))
+        return True
+
+    def write_file(self, parts, data):
+        parent = self.make_dirs(parts[:-1])
+        parent.set_child(parts[-1], OverlayFile(parts[-1], data))
+        self.journal.append(("write", "/" + "/".join(parts), data))
+
+    def save_delta(self, path):
+        # Архив изменений: журнал операций в манифесте и содержимое новых файлов
+        manifest = []
+        with tarfile.open(path, "w") as tar:
+            for i, (operation, *args) in enumerate(self.journal):
+                if operation == "write":
+                    file_path, data = args
+                    info = tarfile.TarInfo(f"data/{i}")
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+                    manifest.append({"op": operation, "path": file_path, "data": info.name})
+                elif operation == "move":
+                    manifest.append({"op": operation, "src": args[0], "dst": args[1]})
+                else:
+                    manifest.append({"op": operation, "path": args[0]})
+
+            manifest_data = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+            info = tarfile.TarInfo(self.MANIFEST_NAME)
+            info.size = len(manifest_data)
+            tar.addfile(info, io.BytesIO(manifest_data))
+
+    def apply_delta(self, path):
+        # Повторяем операции сохранённого журнала поверх текущего слоя
+        with tarfile.open(path) as tar:
+            manifest = json.load(tar.extractfile(self.MANIFEST_NAME))
+            for entry in manifest:
+                if entry["op"] == "mkdir":
+                    self.mkdir(self.split(entry["path"]))
+                elif entry["op"] == "move":
+                    self.move(self.split(entry["src"]), self.split(entry["dst"]))
+                elif entry["op"] == "write":
+                    self.write_file(self.split(entry["path"]), tar.extractfile(entry["data"]).read())
+
+
+class MemberFile(io.RawIOBase):
+    """Окно в открытом архиве, ограниченное данными одного члена."""
+
+    def __init__(self, read_at, start, size):
+        self._read_at = read_at  # Потокобезопасное чтение (смещение, размер) из архива
+        self._start = start
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._pos)
+        if size <= 0:
+            return 0
+        data = self._read_at(self._start + self._pos, size)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def read_head(stream, num_lines):
+    # Читаем строки по мере надобности и останавливаемся после num_lines
+    with io.TextIOWrapper(stream, encoding='utf-8') as text:
+        return [line.rstrip("\n") for line in islice(text, max(num_lines, 0))]
+
+
+def read_tail(stream, num_lines, block_size=8192):
+    # Читаем блоки с конца потока, пока не наберём num_lines переводов строк
+    with stream:
+        if num_lines <= 0:
+            return []
+        size = end = stream.seek(0, io.SEEK_END)
+        blocks = []
+        newlines = 0
+        while end > 0 and newlines <= num_lines:
+            start = max(0, end - block_size)
+            stream.seek(start)
+            block = stream.read(end - start)
+            # Завершающий перевод строки не начинает новую строку
+            newlines += block.count(b"\n") - (end == size and block.endswith(b"\n"))
+            blocks.append(block)
+            end = start
+    data = b"".join(reversed(blocks))
+    if end > 0:
+        # Первая строка может быть обрезана посередине символа, она не нужна
+        data = data[data.index(b"\n") + 1:]
+    return data.decode('utf-8').splitlines()[-num_lines:]
+
+
+# Сигнатуры сжатых архивов и шаг контрольных точек для gzip
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gz",
+    b"\xfd7zXZ\x00": "xz",
+    b"BZh": "bz2",
+    b"\x28\xb5\x2f\xfd": "zst",
+}
+CHECKPOINT_SPACING = 16 * 1024 * 1024
+
+
+def new_decompressor(kind):
+    # Потоковый распаковщик для одного сжатого потока
+    if kind == "gz":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if kind == "xz":
+        return lzma.LZMADecompressor()
+    if kind == "bz2":
+        return bz2.BZ2Decompressor()
+    if zstandard is None:
+        raise tarfile.ReadError("zstandard module is not available")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+class DecompressedStream(io.RawIOBase):
+    """
+    Распакованное содержимое сжатого архива как поток с произвольным доступом.
+    Подклассы определяют _advance(): распаковать следующий блок и запомнить его.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, file, kind):
+        self._file = file
+        self._kind = kind
+        self._decompressor = new_decompressor(kind)
+        self._fresh = True  # Распаковщик ещё не получил данных
+        self._in_pos = 0  # Смещение следующего сжатого блока
+        self._out_pos = 0  # Распакованное смещение конца уже полученных данных
+        self._eof = False
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            while not self._eof:
+                self._advance()
+            offset += self._out_pos
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _decompress_chunk(self):
+        # Распаковываем следующий сжатый блок; b"" в конце потока
+        self._file.seek(self._in_pos)
+        data = self._file.read(self.CHUNK_SIZE)
+        # Нулевое выравнивание после последнего потока не является новым потоком
+        if not data or (self._fresh and data[:1] == b"\0"):
+            self._eof = True
+            return b""
+        output = self._decompressor.decompress(data)
+        self._fresh = False
+        if self._decompressor.eof:
+            # Сжатый файл может состоять из нескольких потоков подряд
+            self._in_pos += len(data) - len(self._decompressor.unused_data)
+            self._decompressor = new_decompressor(self._kind)
+            self._fresh = True
+        else:
+            self._in_pos += len(data)
+        self._out_pos += len(output)
+        return output
+
+
+class GzipCheckpointReader(DecompressedStream):
+    """
+    Gzip с таблицей контрольных точек.
+
+    При первом проходе каждые spacing распакованных байт сохраняется копия
+    состояния распаковщика. Чтение с произвольного смещения продолжает
+    распаковку с ближайшей точки, а не с начала архива.
+    """
+
+    def __init__(self, file, spacing=CHECKPOINT_SPACING):
+        super().__init__(file, "gz")
+        self._spacing = spacing
+        self._buffer = b""  # Последний распакованный фрагмент, заканчивается на _out_pos
+        self._checkpoints = [(0, 0, self._decompressor.copy(), True)]
+        self._checkpoint_offsets = [0]
+
+    def _advance(self):
+        self._buffer = self._decompress_chunk()
+        if self._out_pos - self._checkpoint_offsets[-1] >= self._spacing:
+            self._checkpoints.append((self._out_pos, self._in_pos, self._decompressor.copy(), self._fresh))
+            self._checkpoint_offsets.append(self._out_pos)
+
+    def _restore(self, index):
+        self._out_pos, self._in_pos, decompressor, self._fresh = self._checkpoints[index]
+        # Сохранённая копия должна остаться нетронутой для следующих переходов
+        self._decompressor = decompressor.copy()
+        self._buffer = b""
+        self._eof = False
+
+    def readinto(self, buffer):
+        index = bisect.bisect_right(self._checkpoint_offsets, self._pos) - 1
+        if self._pos < self._out_pos - len(self._buffer) or self._checkpoint_offsets[index] > self._out_pos:
+            self._restore(index)
+
+        count = 0
+        while count < len(buffer):
+            if self._pos >= self._out_pos:
+                if self._eof:
+                    break
+                self._advance()
+                continue
+            start = self._pos - (self._out_pos - len(self._buffer))
+            chunk = self._buffer[start:start + len(buffer) - count]
+            buffer[count:count + len(chunk)] = chunk
+            count += len(chunk)
+            self._pos += len(chunk)
+        return count
+
+
+class SpoolReader(DecompressedStream):
+    """
+    Форматы без копируемого состояния распаковщика (xz, bz2, zstd).
+
+    Распакованные данные по мере продвижения дописываются во временный файл,
+    поэтому каждый участок архива распаковывается не более одного раза.
+    """
+
+    def __init__(self, file, kind):
+        super().__init__(file, kind)
+        self._spool = tempfile.TemporaryFile()
+
+    def _advance(self):
+        output = self._decompress_chunk()
+        self._spool.seek(0, io.SEEK_END)
+        self._spool.write(output)
+
+    def readinto(self, buffer):
+        while self._pos + len(buffer) > self._out_pos and not self._eof:
+            self._advance()
+        self._spool.seek(self._pos)
+        count = self._spool.readinto(buffer)
+        self._pos += count
+        return count
+
+    def close(self):
+        self._spool.close()
+        super().close()
+
+
+def open_decompressed(file, checkpoint_spacing=CHECKPOINT_SPACING):
+    # Поток несжатого tar: сам файл или распаковывающая обёртка над ним
+    magic = file.read(6)
+    file.seek(0)
+    for prefix, kind in COMPRESSION_MAGIC.items():
+        if magic.startswith(prefix):
+            if kind == "gz":
+                return GzipCheckpointReader(file, checkpoint_spacing)
+            return SpoolReader(file, kind)
+    return file
+
+
+class ArchiveReader:
+    """
+    Tar-архив, открытый на всё время сессии.
+
+    Данные члена читаются по смещению offset_data из его TarInfo: одно
+    позиционирование и одно чтение вместо повторного обхода заголовков.
+    Сжатые архивы читаются через поток с произвольным доступом, поэтому
+    смещения те же, что и в несжатом tar.
+    """
+
+    def __init__(self, path, checkpoint_spacing=CHECKPOINT_SPACING):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.stream = open_decompressed(self.file, checkpoint_spacing)
+            self.tar = tarfile.open(fileobj=self.stream, mode="r:")
+        except Exception:
+            self.file.close()
+            raise
+        # Одним читателем пользуются несколько сессий сервера одновременно
+        self.lock = threading.Lock()
+        # Несжатый файл читается через pread без общей позиции и без блокировки
+        self.pread = self.stream is self.file and hasattr(os, "pread")
+
+    def members(self):
+        with self.lock:
+            return self.tar.getmembers()
+
+    def read_at(self, offset, size):
+        if self.pread:
+            return os.pread(self.file.fileno(), size, offset)
+        with self.lock:
+            self.stream.seek(offset)
+            return self.stream.read(size)
+
+    def read(self, info, offset=0, size=None):
+        # Читаем size байт данных члена начиная с offset (по умолчанию до конца)
+        offset = min(offset, info.size)
+        if size is None or size > info.size - offset:
+            size = info.size - offset
+        if not info.issparse():
+            return self.read_at(info.offset_data + offset, size)
+        with self.open(info) as member:
+            member.seek(offset)
+            return member.read(size)
+
+    def open(self, info):
+        # Буферизованный поток данных члена для чтения по частям
+        if not info.issparse():
+            return io.BufferedReader(MemberFile(self.read_at, info.offset_data, info.size))
+        # Разрежённый член собираем из фрагментов через TarFile целиком под блокировкой
+        with self.lock:
+            return io.BytesIO(self.tar.extractfile(info).read())
+
+    def close(self):
+        self.tar.close()
+        if self.stream is not self.file:
+            self.stream.close()
+        self.file.close()
+
+
+# Индекс-спутник архива: заголовок, таблица записей фиксированной длины и таблица имён
+INDEX_MAGIC = b"VFSIDX01"
+INDEX_HEADER = struct.Struct("<8sQqI")  # сигнатура, размер архива, mtime_ns, число записей
+INDEX_RECORD = struct.Struct("<QQdIcII")  # смещение данных, размер, mtime, mode, тип, имя
+
+
+def load_index(index_path, archive_stat):
+    """
+    Читает индекс-спутник архива через mmap.
+
+    :return: Список Entry или None, если индекса нет или он не соответствует архиву
+    """
+    try:
+        with open(index_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(data, 0)
+            if (magic != INDEX_MAGIC or size != archive_stat.st_size
+                    or mtime_ns != archive_stat.st_mtime_ns):
+                return None
+
+            names_start = INDEX_HEADER.size + count * INDEX_RECORD.size
+            members = []
+            for i in range(count):
+                offset, size, mtime, mode, type_, name_start, name_length = INDEX_RECORD.unpack_from(
+                    data, INDEX_HEADER.size + i * INDEX_RECORD.size)
+                name_start += names_start
+                name = data[name_start:name_start + name_length].decode('utf-8', 'surrogateescape')
+                members.append(Entry(name, type_, size, offset, mode, mtime))
+            return members
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def save_index(index_path, archive_stat, members):
+    """Записывает индекс-спутник; при невозможности записи индекс просто не создаётся."""
+    records = []
+    names = []
+    names_size = 0
+    for info in members:
+        name = info.name.encode('utf-8', 'surrogateescape')
+        records.append(INDEX_RECORD.pack(info.offset_data, info.size, info.mtime, info.mode,
+                                         info.type, names_size, len(name)))
+        names.append(name)
+        names_size += len(name)
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, archive_stat.st_size, archive_stat.st_mtime_ns, len(records)))
+            file.writelines(records)
+            file.writelines(names)
+        # Атомарная замена, чтобы параллельный запуск не прочитал недописанный индекс
+        os.replace(tmp_path, index_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Archive:
+    """Смонтированный tar-архив: открытый файл и дерево каталогов загружаются при первом обращении."""
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        # Индекс-спутник по умолчанию лежит рядом с архивом
+        self.index_path = index_path if index_path is not None else path + ".idx"
+        self.reader = None
+        self.tree = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.tree is not None:
+            return self.tree
+        with self._lock:
+            if self.tree is None:
+                self._load()
+        return self.tree
+
+    def _load(self):
+        # Открываем архив один раз на всю сессию
+        reader = ArchiveReader(self.path)
+        archive_stat = os.stat(self.path)
+
+        # Полный обход заголовков нужен, только если индекс-спутник отсутствует или устарел
+        members = load_index(self.index_path, archive_stat)
+        if members is None:
+            members = reader.members()
+            # Разрежённые члены требуют карты фрагментов, которой нет в индексе
+            if not any(member.issparse() for member in members):
+                save_index(self.index_path, archive_stat, members)
+
+        tree = FileTree(self)
+        for member in members:
+            tree.add(member)
+        # Полные TarInfo больше не нужны: дерево хранит компактные записи
+        reader.tar.members = []
+        self.reader, self.tree = reader, tree
+
+    def open(self, info):
+        return self.reader.open(info)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+            self.tree = None
+
+
+class MountNode:
+    """
+    Каталог таблицы монтирования.
+
+    Объединяет корень смонтированного здесь архива (или каталог архива
+    родительской точки на том же пути) с вложенными точками монтирования.
+    """
+
+    def __init__(self, info, parent=None, name=None):
+        self.info = info
+        self.archive = None
+        self.parent = parent
+        self.name = name
+        self.mounts = {}  # Имя -> MountNode вложенных точек монтирования
+        self._resolved = False
+        self._base = None
+        self.error = None  # Ошибка открытия смонтированного архива
+
+    def isdir(self):
+        return True
+
+    def base(self):
+        # Каталог архива под этой точкой; индекс архива загружается только здесь
+        if not self._resolved:
+            if self.archive is not None:
+                try:
+                    self._base = self.archive.load().root
+                except (OSError, tarfile.TarError) as e:
+                    # Недоступный архив показывается пустым каталогом, ошибка запоминается,
+                    # чтобы не открывать его заново при каждом обращении
+                    self.error = e
+            elif self.parent is not None:
+                parent_base = self.parent.base()
+                node = parent_base.child(self.name) if parent_base is not None else None
+                self._base = node if node is not None and node.isdir() else None
+            self._resolved = True
+        return self._base
+
+    def child(self, name):
+        if name in self.mounts:
+            return self.mounts[name]
+        base = self.base()
+        return base.child(name) if base is not None else None
+
+    def items(self):
+        base = self.base()
+        if base is not None:
+            for name, node in base.items():
+                if name not in self.mounts:
+                    yield name, node
+        yield from self.mounts.items()
+
+
+class MountTable(FileTree):
+    """
+    Таблица монтирования нескольких архивов в одно дерево.
+
+    Путь разрешается проходом по компонентам, то есть за O(глубина пути);
+    индекс архива загружается при первом обращении к его точке монтирования.
+    """
+
+    def __init__(self):
+        self.root = MountNode(self._dir_info([]))
+        self.archives = []
+
+    def mount(self, path, archive):
+        parts = self.split(path)
+        node = self.root
+        for i, part in enumerate(parts):
+            child = node.mounts.get(part)
+            if child is None:
+                child = node.mounts[part] = MountNode(self._dir_info(parts[:i + 1]), node, part)
+            node = child
+        if node.archive is not None:
+            raise ValueError(f"'{path}' is already a mount point")
+        node.archive = archive
+        self.archives.append(archive)
+        return node
+
+    def close(self):
+        for archive in self.archives:
+            archive.close()
+
 
 class ShellEmulator:
-    def __init__(self, tar_file_path, shell_invite):
+    def __init__(self, tar_file_path, shell_invite, index_path=None, mounts=None, base=None, out=None):
         self.shell_invite = shell_invite
         self.tar_file_path = tar_file_path
+        self.index_path = index_path
+        # Дополнительные архивы: виртуальный путь -> путь к tar-файлу
+        self.mounts = mounts or {}
         self.current_path = "/"  # Начальный путь как в UNIX
-        self.file_system = {}
+        self.out = out  # Поток вывода сессии; None — текущий sys.stdout
+        # Уже загруженную таблицу монтирования может разделять несколько сессий
+        self.owns_base = base is None
+        self.base = MountTable() if base is None else base  # Неизменяемые деревья архивов
+        self.file_system = Overlay(self.base)  # Изменения сессии поверх них
 
-        # Загружаем файловую систему из tar
-        self.load_file_system()
+        # Таблица команд: имя -> обработчик строки аргументов
+        self.commands = {
+            "ls": self._cmd_ls,
+            "cd": self._cmd_cd,
+            "pwd": self._cmd_pwd,
+            "mv": self._cmd_mv,
+            "cat": self._cmd_cat,
+            "mkdir": self._cmd_mkdir,
+            "touch": self._cmd_touch,
+            "save": self._cmd_save,
+            "head": self._cmd_head,
+            "tail": self._cmd_tail,
+            "find": self._cmd_find,
+            "du": self._cmd_du,
+            "grep": self._cmd_grep,
+            "exit": self._cmd_exit,
+        }
+
+        # Загружаем файловую систему из tar, если она не передана готовой
+        if self.owns_base:
+            self.load_file_system()
 
     def load_file_system(self):
-        # Распаковка tar-файла в словарь self.file_system
-        with tarfile.open(self.tar_file_path) as tar:
-            for member in tar.getmembers():
-                self.file_system[member.name] = member
+        # Основной архив монтируется в корень и загружается сразу, остальные — при первом обращении
+        root = Archive(self.tar_file_path, self.index_path)
+        root.load()
+        self.base.mount("/", root)
+        for path, archive_path in self.mounts.items():
+            # Отсутствующий архив обнаруживается сразу, как и для корня; индекс читается позже
+            os.stat(archive_path)
+            self.base.mount(path, Archive(archive_path))
+        self.file_system = Overlay(self.base)
 
+    @property
+    def archive(self):
+        # Открытый основной архив
+        return self.base.root.archive.reader
 
-    def ls(self):
-        # Получаем полный путь текущей директории
-        path = self._get_full_path(self.current_path).replace("\\", "./")
+    def close(self):
+        # Закрываем все архивы, открытые за время сессии, если они принадлежат ей
+        if self.owns_base:
+            self.base.close()
 
-        # Находим все элементы, находящиеся внутри текущей директории
-        contents = [name for name in self.file_system if name.startswith(path) and name != path]
-        display_names = set()
+    def _print(self, *args, **kwargs):
+        print(*args, file=self.out if self.out is not None else sys.stdout, **kwargs)
 
-        for content in contents:
-            # Получаем относительное имя и первую часть пути
-            rel_path = content[len(path):].strip("/")
-            display_name = rel_path.split("/", 1)[0]
-            display_names.add(display_name)
+    def __enter__(self):
+        return self
 
-        print("  ".join(sorted(display_names)))
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ls(self):
+        # Содержимое текущей директории берём прямо из её узла
+        node = self.file_system.lookup(self.current_path)
+        if node is None or not node.isdir():
+            self._print(f"ls: cannot access '{self.current_path}': No such file or directory")
+            return
+
+        names = sorted(name for name, _ in node.items())
+        mount = node.base if isinstance(node, OverlayDir) else node
+        error = getattr(mount, "error", None)
+        if error is not None:
+            self._print(f"ls: cannot access '{self.current_path}': {getattr(error, 'strerror', None) or error}")
+            return
+        self._print("  ".join(names))
 
     def cd(self, path=None):
         # Если path не указан или указан как "..", возвращаемся в корень
@@ -48,119 +935,215 @@ class ShellEmulator:
             return
 
         # Меняем текущую директорию на указанную в path
-        new_path = self._get_new_path(path)
-        full_path = self._get_full_path(new_path).replace("\\", "./")
+        new_path = self._get_full_path(self._get_new_path(path)).replace("\\", "/")
 
         # Проверка, существует ли целевая директория
-        if full_path in self.file_system and self.file_system[full_path].isdir():
+        node = self.file_system.lookup(new_path)
+        if node is not None and node.isdir():
             self.current_path = new_path
         else:
-            print(f"cd: no such file or directory: {path}")
+            self._print(f"cd: no such file or directory: {path}")
 
     def pwd(self):
         # Выводим текущий путь
-        print(self.current_path)
+        self._print(self.current_path)
 
     def mv(self, src, dst):
         # Получаем абсолютные пути для исходного и целевого файлов
         src_path = '.' + self._get_full_path(os.path.join(self.current_path, src)).replace("\\", "/")
         dst_path = '.' + self._get_full_path(os.path.join(self.current_path, dst)).replace("\\", "/")
+        src_parts = self.file_system.split(src_path)
+        dst_parts = self.file_system.split(dst_path)
 
         # Проверка существования исходного файла или директории
-        if src_path not in self.file_system:
-            print(self.file_system)
-            print(f"mv: cannot stat '{src_path}': No such file or directory")
-            return
-
-        # Если целевой путь существует и является файлом, ошибка
-        if dst_path in self.file_system and self.file_system[dst_path].isfile():
-            print(f"mv: cannot move '{src}' to '{dst}': File exists")
+        src_node = self.file_system.lookup(src_parts)
+        if src_node is None or not src_parts:
+            self._print(f"mv: cannot stat '{src_path}': No such file or directory")
             return
 
+        dst_node = self.file_system.lookup(dst_parts)
         # Проверка, если целевой путь является существующей директорией
-        if dst_path in self.file_system and self.file_system[dst_path].isdir():
+        if dst_node is not None and dst_node.isdir():
             # Перемещаем в существующую директорию
-            dst_path = os.path.join(dst_path, os.path.basename(src_path)).replace("\\", "./")
+            dst_parts = dst_parts + [src_parts[-1]]
+            dst_node = dst_node.child(src_parts[-1])
+
+        # Если целевой путь уже существует, ошибка
+        if dst_node is not None:
+            self._print(f"mv: cannot move '{src}' to '{dst}': File exists")
+            return
+
+        if dst_parts[:len(src_parts)] == src_parts:
+            self._print(f"mv: cannot move '{src}' to a subdirectory of itself, '{dst}'")
+            return
 
-        # Выполняем переименование/перемещение
-        items_to_move = {key: value for key, value in self.file_system.items() if key.startswith(src_path)}
-        for old_path, item in items_to_move.items():
-            # Обновляем путь каждого элемента
-            new_path = old_path.replace(src_path, dst_path, 1)
-            self.file_system[new_path] = self.file_system.pop(old_path)
+        # Перенос узла целиком в слое изменений; недостающие каталоги создаются
+        if not self.file_system.move(src_parts, dst_parts):
+            self._print(f"mv: cannot move '{src}' to '{dst}': Not a directory")
+            return
 
-        print(f"Moved '{src}' to '{dst}'")
+        self._print(f"Moved '{src}' to '{dst}'")
 
     def cat(self, filename):
         # Генерируем полный путь к файлу, учитывая текущую директорию
         full_path = self._get_full_path(os.path.join(self.current_path, filename)).replace("\\", "/")
-        print(f"[DEBUG] Trying to access file at path: '{full_path}'")
+        self._print(f"[DEBUG] Trying to access file at path: '{full_path}'")
 
         # Проверяем, существует ли файл в файловой системе
-        if '.' + full_path in self.file_system:
-            file_info = self.file_system['.'+full_path]
-
+        node = self.file_system.lookup(full_path)
+        if node is not None:
             # Проверяем, является ли указанный путь файлом, а не директорией
-            if file_info.isfile():
-                # Пытаемся прочитать содержимое файла из архива
-                with tarfile.open(self.tar_file_path) as tar:
-                    try:
-                        file_content = tar.extractfile(file_info)
-                        if file_content:
-                            print(file_content.read().decode('utf-8'))
-                        else:
-                            print(f"cat: {filename}: Cannot read file content")
-                    except KeyError:
-                        print(f"cat: {filename}: No such file or directory in archive")
+            if node.info.isfile():
+                with self._open(node) as file_content:
+                    self._print(file_content.read().decode('utf-8'))
             else:
-                print(f"cat: {filename}: Is a directory")
+                self._print(f"cat: {filename}: Is a directory")
         else:
-            print(f"cat: {filename}: No such file or directory")
+            self._print(f"cat: {filename}: No such file or directory")
 
 
     def mkdir(self, dirname):
         # Преобразуем путь новой директории в абсолютный
-        dir_path = self._get_full_path(os.path.join(self.current_path, dirname)).replace("\\", "./")
+        dir_path = self._get_full_path(os.path.join(self.current_path, dirname)).replace("\\", "/")
+        parts = self.file_system.split(dir_path)
 
         # Проверяем, существует ли уже директория или файл с таким именем
-        if dir_path in self.file_system:
-            print(f"mkdir: cannot create directory '{dirname}': Directory exists")
+        if self.file_system.lookup(parts) is not None:
+            self._print(f"mkdir: cannot create directory '{dirname}': Directory exists")
+            return
+
+        parent = self.file_system.lookup(parts[:-1])
+        if parent is None or not parent.isdir():
+            self._print(f"mkdir: cannot create directory '{dirname}': No such file or directory")
+            return
+
+        # Новый каталог появляется только в слое изменений
+        self.file_system.mkdir(parts)
+
+    def touch(self, filename):
+        # Создаём пустой файл в слое изменений, существующий файл не трогаем
+        file_path = self._get_full_path(os.path.join(self.current_path, filename)).replace("\\", "/")
+        parts = self.file_system.split(file_path)
+        if self.file_system.lookup(parts) is not None:
+            return
+
+        parent = self.file_system.lookup(parts[:-1])
+        if not parts or parent is None or not parent.isdir():
+            self._print(f"touch: cannot touch '{filename}': No such file or directory")
             return
 
-        # Создаем новый объект TarInfo для директории и добавляем в файловую систему
-        new_dir = tarfile.TarInfo(name=dir_path)
-        new_dir.type = tarfile.DIRTYPE
-        self.file_system[dir_path] = new_dir
+        self.file_system.write_file(parts, b"")
+
+    def save(self, path):
+        # Сохраняем изменения сессии в отдельный архив, исходный архив не меняется
+        self.file_system.save_delta(path)
+        self._print(f"Saved {len(self.file_system.journal)} change(s) to '{path}'")
 
     def head(self, filename, num_lines=10):
         # Генерируем полный путь к файлу, учитывая текущую директорию
         full_path = '.' + self._get_full_path(os.path.join(self.current_path, filename)).replace("\\", "/")
-        print(f"[DEBUG] Trying to access file at path: '{full_path}'")
+        self._print(f"[DEBUG] Trying to access file at path: '{full_path}'")
 
         # Проверяем, существует ли файл в файловой системе
-        if full_path in self.file_system:
-            file_info = self.file_system[full_path]
-
+        node = self.file_system.lookup(full_path)
+        if node is not None:
             # Проверяем, является ли указанный путь файлом, а не директорией
-            if file_info.isfile():
-                # Пытаемся прочитать содержимое файла из архива
-                with tarfile.open(self.tar_file_path) as tar:
-                    try:
-                        file_content = tar.extractfile(file_info)
-                        if file_content:
-                            # Чтение и декодирование содержимого файла
-                            lines = file_content.read().decode('utf-8').splitlines()
-                            # Вывод первых num_lines строк
-                            for line in lines[:num_lines]:
-                                print(line)
-                        else:
-                            print(f"head: {filename}: Cannot read file content")
-                    except KeyError:
-                        print(f"head: {filename}: No such file or directory in archive")
+            if node.info.isfile():
+                # Вывод первых num_lines строк без чтения остальной части файла
+                for line in read_head(self._open(node), num_lines):
+                    self._print(line)
+            else:
+                self._print(f"head: {filename}: Is a directory")
+        else:
+            self._print(f"head: {filename}: No such file or directory")
+
+    def tail(self, filename, num_lines=10):
+        # Генерируем полный путь к файлу, учитывая текущую директорию
+        full_path = '.' + self._get_full_path(os.path.join(self.current_path, filename)).replace("\\", "/")
+
+        node = self.file_system.lookup(full_path)
+        if node is not None:
+            if node.info.isfile():
+                # Вывод последних num_lines строк, читая файл блоками с конца
+                for line in read_tail(self._open(node), num_lines):
+                    self._print(line)
             else:
-                print(f"head: {filename}: Is a directory")
+                self._print(f"tail: {filename}: Is a directory")
         else:
-            print(f"head: {filename}: No such file or directory")
+            self._print(f"tail: {filename}: No such file or directory")
+
+    def find(self, path=".", pattern=None):
+        # Рекурсивный поиск по индексу; pattern сравнивается с именем в стиле glob
+        node = self.file_system.lookup(self._get_full_path(os.path.join(self.current_path, path)))
+        if node is None:
+            self._print(f"find: '{path}': No such file or directory")
+            return
+
+        for file_path, _ in self.file_system.walk(node, path):
+            if pattern is None or fnmatch.fnmatchcase(file_path.rstrip("/").rsplit("/", 1)[-1], pattern):
+                self._print(file_path)
+
+    def du(self, path=".", summarize=False):
+        # Размеры берутся из заголовков архива, данные файлов не читаются
+        node = self.file_system.lookup(self._get_full_path(os.path.join(self.current_path, path)))
+        if node is None:
+            self._print(f"du: cannot access '{path}': No such file or directory")
+            return
+        if not node.isdir():
+            self._print(f"{node.info.size}\t{path}")
+            return
+
+        # Обход в обратном порядке без рекурсии: итог каталога печатается после его содержимого
+        stack = [[path, iter(sorted(node.items(), key=lambda item: item[0])), 0]]
+        while stack:
+            frame = stack[-1]
+            child = next(frame[1], None)
+            if child is None:
+                stack.pop()
+                if not summarize or not stack:
+                    self._print(f"{frame[2]}\t{frame[0]}")
+                if stack:
+                    stack[-1][2] += frame[2]
+            elif child[1].isdir():
+                stack.append([self.file_system.join(frame[0], child[0]),
+                              iter(sorted(child[1].items(), key=lambda item: item[0])), 0])
+            else:
+                frame[2] += child[1].info.size
+
+    def grep(self, pattern, path=".", ignore_case=False):
+        try:
+            regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            self._print(f"grep: invalid pattern '{pattern}': {e}")
+            return
+
+        node = self.file_system.lookup(self._get_full_path(os.path.join(self.current_path, path)))
+        if node is None:
+            self._print(f"grep: {path}: No such file or directory")
+            return
+
+        files = [(file_path, child) for file_path, child in self.file_system.walk(node, path)
+                 if child.info.isfile()]
+        # Члены архива читаются в порядке смещений: весь поиск — один последовательный проход
+        files.sort(key=lambda item: self._read_order(item[1]))
+        for file_path, child in files:
+            with io.TextIOWrapper(self._open(child), encoding='utf-8', errors='replace') as text:
+                for line in text:
+                    if regex.search(line):
+                        line = line.rstrip("\n")
+                        self._print(f"{file_path}:{line}" if node.isdir() else line)
+
+    def _read_order(self, node):
+        # Файлы слоя изменений лежат в памяти и читаются первыми
+        if isinstance(node, OverlayFile):
+            return 0, "", 0
+        return 1, node.archive.path, node.info.offset_data
+
+    def _open(self, node):
+        # Поток содержимого файла: из слоя изменений или из открытого архива
+        if isinstance(node, OverlayFile):
+            return io.BytesIO(node.data)
+        return node.archive.open(node.info)
 
     def _get_full_path(self, path):
         # Преобразуем относительный путь в абсолютный
@@ -175,53 +1158,282 @@ class ShellEmulator:
         else:
             return os.path.join(self.current_path, path)
 
+    def _cmd_ls(self, argument):
+        self.ls()
+
+    def _cmd_cd(self, argument):
+        # Путь может отсутствовать: тогда возвращаемся в корень
+        self.cd(argument or None)
+
+    def _cmd_pwd(self, argument):
+        self.pwd()
+
+    def _cmd_mv(self, argument):
+        # Разделяем аргументы на исходный и целевой путь
+        parts = argument.split(maxsplit=1)
+        if len(parts) < 2:
+            self._print("mv: missing destination file operand")
+            return
+        self.mv(*parts)
+
+    def _cmd_cat(self, argument):
+        self._with_operand("cat", argument, self.cat)
+
+    def _cmd_mkdir(self, argument):
+        self._with_operand("mkdir", argument, self.mkdir)
+
+    def _cmd_touch(self, argument):
+        self._with_operand("touch", argument, self.touch)
+
+    def _cmd_save(self, argument):
+        self._with_operand("save", argument, self.save)
+
+    def _cmd_head(self, argument):
+        self._with_line_count("head", argument, self.head)
+
+    def _cmd_tail(self, argument):
+        self._with_line_count("tail", argument, self.tail)
+
+    def _cmd_find(self, argument):
+        # find [путь] [-name шаблон]
+        parts = argument.split()
+        path, pattern = ".", None
+        while parts:
+            token = parts.pop(0)
+            if token == "-name":
+                if not parts:
+                    self._print("find: missing argument to '-name'")
+                    return
+                pattern = parts.pop(0)
+            else:
+                path = token
+        self.find(path, pattern)
+
+    def _cmd_du(self, argument):
+        # du [-s] [путь]
+        parts = argument.split()
+        summarize = "-s" in parts
+        paths = [part for part in parts if part != "-s"]
+        self.du(paths[0] if paths else ".", summarize)
+
+    def _cmd_grep(self, argument):
+        # grep [-i] шаблон [путь]
+        parts = argument.split()
+        ignore_case = "-i" in parts
+        parts = [part for part in parts if part != "-i"]
+        if not parts:
+            self._print("grep: missing pattern")
+            return
+        self.grep(parts[0], parts[1] if len(parts) > 1 else ".", ignore_case)
+
+    def _cmd_exit(self, argument):
+        self._print("Выход из shell")
+        return False
+
+    def _with_operand(self, name, argument, handler):
+        if not argument:
+            self._print(f"{name}: missing operand")
+            return
+        handler(argument)
+
+    def _with_line_count(self, name, argument, handler):
+        # Обработка команд head/tail с необязательным числом строк
+        parts = argument.split()
+        if not parts:
+            self._print(f"{name}: missing operand")
+            return
+        try:
+            num_lines = int(parts[1]) if len(parts) > 1 else 10
+        except ValueError:
+            num_lines = -1
+        if num_lines < 0:
+            self._print(f"{name}: invalid number of lines: '{parts[1]}'")
+            return
+        handler(parts[0], num_lines)
+
+    @staticmethod
+    def parse_script(lines):
+        # Разбираем скрипт заранее: пустые строки и комментарии '#' пропускаются
+        commands = []
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                commands.append(line)
+        return commands
+
+    def execute(self, command):
+        """
+        Выполняет одну команду через таблицу команд.
+
+        :return: False, если после команды сессию нужно завершить
+        """
+        name, _, argument = command.strip().partition(" ")
+        handler = self.commands.get(name)
+        if handler is None:
+            self._print(f"{command}: command not found")
+            return True
+        return handler(argument.strip()) is not False
+
+    def run_script(self, lines):
+        """
+        Неинтерактивное выполнение скрипта с замером времени каждой команды.
+
+        :return: Отчёт в виде словаря, пригодный для json.dump
+        """
+        report = []
+        started = time.perf_counter()
+        for command in self.parse_script(lines):
+            command_started = time.perf_counter()
+            entry = {"command": command}
+            try:
+                proceed = self.execute(command)
+            except Exception as e:
+                # Ошибка одной команды не прерывает скрипт, но попадает в отчёт
+                entry["error"] = f"{type(e).__name__}: {e}"
+                proceed = True
+            entry["seconds"] = time.perf_counter() - command_started
+            report.append(entry)
+            if not proceed:
+                break
+        return {
+            "archive": self.tar_file_path,
+            "commands": report,
+            "total_seconds": time.perf_counter() - started,
+        }
+
     def run(self):
         # Основной цикл эмуляции командной строки
         while True:
             try:
                 command = input(f"{self.shell_invite}:{self.current_path}$ ")
-                if command.startswith("ls"):
-                    self.ls()
-                elif command.startswith("cd"):
-                    # Разделяем команду с учетом возможного отсутствия аргументов
-                    parts = command.split(maxsplit=1)
-                    path = parts[1] if len(parts) > 1 else None
-                    self.cd(path)
-                elif command == "pwd":
-                    self.pwd()
-                elif command.startswith("mv "):
-                    # Разделяем команду на исходный и целевой путь
-                    _, src, dst = command.split(maxsplit=2)
-                    self.mv(src, dst)
-                elif command.startswith("cat "):
-                    _, filename = command.split(maxsplit=1)
-                    self.cat(filename)
-                elif command.startswith("mkdir "):
-                    _, dirname = command.split(maxsplit=1)
-                    self.mkdir(dirname)
-                elif command.startswith("head "):
-                    # Обработка команды head с указанием числа строк
-                    parts = command.split()
-                    filename = parts[1]
-                    num_lines = int(parts[2]) if len(parts) > 2 else 10
-                    self.head(filename, num_lines)
-                elif command == "exit":
-                    print("Выход из shell")
+                if not self.execute(command):
                     break
-                elif command == "test":
-                    self.test_commands()
-                else:
-                    print(f"{command}: command not found")
-            except KeyboardInterrupt:
-                print("\nВыход из shell")
+            except (KeyboardInterrupt, EOFError):
+                self._print("\nВыход из shell")
                 break
+            except Exception as e:
+                # Ошибка одной команды не завершает сессию и не теряет изменения
+                self._print(f"{command}: {type(e).__name__}: {e}")
 
 
+class ShellServer:
+    """
+    Asyncio-сервер с множеством сессий над одной загруженной таблицей монтирования.
 
+    Индексы архивов и их читатели общие, а у каждого подключения свои
+    текущая директория и слой изменений. Команды выполняются в общем пуле
+    потоков, чтобы чтение больших файлов не останавливало цикл событий.
+    """
 
-# Запуск эмулятора
-if __name__ == "__main__":
-    with open("config.json", 'r') as file:
+    # Команды, которые не выполняются в сессиях по сокету
+    FORBIDDEN_COMMANDS = ("save",)
+
+    def __init__(self, base, shell_invite, max_workers=8):
+        self.base = base
+        self.shell_invite = shell_invite
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.sessions = 0
+
+    def _run_command(self, shell, command):
+        # Вывод команды собирается в буфер сессии и отправляется клиенту целиком
+        shell.out = io.StringIO()
+        try:
+            proceed = shell.execute(command)
+        except Exception as e:
+            shell._print(f"{command}: {type(e).__name__}: {e}")
+            proceed = True
+        return proceed, shell.out.getvalue()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        shell = ShellEmulator(self.base.root.archive.path, self.shell_invite, base=self.base)
+        # save пишет файл на стороне сервера по любому пути, клиентам он недоступен
+        for name in self.FORBIDDEN_COMMANDS:
+            shell.commands.pop(name, None)
+        self.sessions += 1
+        try:
+            while True:
+                writer.write(f"{shell.shell_invite}:{shell.current_path}$ ".encode('utf-8'))
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', 'replace').strip()
+                proceed, output = await loop.run_in_executor(self.executor, self._run_command, shell, command)
+                writer.write(output.encode('utf-8'))
+                if not proceed:
+                    break
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def start(self, host=None, port=None, unix_path=None):
+        # Unix-сокет, если указан путь, иначе локальный TCP-порт
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle, path=unix_path)
+        return await asyncio.start_server(self.handle, host or "127.0.0.1", port)
+
+    async def serve(self, host=None, port=None, unix_path=None):
+        server = await self.start(host, port, unix_path)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Эмулятор командной оболочки над tar-архивом")
+    parser.add_argument('-c', '--config', default="config.json", help="Путь к файлу конфигурации")
+    parser.add_argument('-s', '--script',
+                        help="Файл со скриптом команд ('-' для стандартного ввода) для неинтерактивного режима")
+    parser.add_argument('-o', '--report',
+                        help="Файл для JSON-отчёта о времени выполнения команд (по умолчанию stderr)")
+    parser.add_argument('--listen', metavar="HOST:PORT",
+                        help="Запустить многопользовательский сервер на локальном TCP-порту")
+    parser.add_argument('--socket', metavar="PATH", help="Запустить многопользовательский сервер на Unix-сокете")
+    parser.add_argument('--workers', type=int, default=8, help="Размер пула потоков сервера (по умолчанию 8)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.config, 'r') as file:
         config = json.load(file)
 
-    ShellEmulator(config['path'], config['name']).run()
+    with ShellEmulator(config['path'], config['name'], mounts=config.get('mounts')) as shell:
+        if args.listen or args.socket:
+            server = ShellServer(shell.base, config['name'], args.workers)
+            host, _, port = (args.listen or "").rpartition(":")
+            try:
+                asyncio.run(server.serve(host or None, int(port) if port else None, args.socket))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.close()
+            return
+
+        if args.script is None:
+            shell.run()
+            return
+
+        if args.script == "-":
+            report = shell.run_script(sys.stdin.readlines())
+        else:
+            with open(args.script, 'r', encoding='utf-8') as file:
+                report = shell.run_script(file.readlines())
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stderr, ensure_ascii=False, indent=2)
+        sys.stderr.write("\n")
+
+
+# Запуск эмулятора
+if __name__ == "__main__":
+    main()
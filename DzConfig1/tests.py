@@ -1,8 +1,13 @@
 import unittest
+import asyncio
 import os
+import sys
 import tarfile
 from io import StringIO, BytesIO
-from emulator import ShellEmulator  # Импортируем ShellEmulator
+from types import SimpleNamespace
+from unittest.mock import patch
+from emulator import ShellEmulator, ShellServer, ArchiveReader, load_index, read_tail  # Импортируем ShellEmulator
+from benchmark import run_benchmark
 
 class TestShellEmulator(unittest.TestCase):
 
@@ -21,10 +26,33 @@ class TestShellEmulator(unittest.TestCase):
                     info.size = len(file_content)
                     tar.addfile(info, BytesIO(file_content))
 
+        # Архив без записей каталогов: каталоги должны появиться неявно
+        cls.nested_tar_path = "test_nested_fs.tar"
+        with tarfile.open(cls.nested_tar_path, "w") as tar:
+            for name in ["dir1/a.txt", "dir1/sub/b.txt", "c.txt"]:
+                file_content = f"Contents of {name}".encode("utf-8")
+                info = tarfile.TarInfo(f"./{name}")
+                info.size = len(file_content)
+                tar.addfile(info, BytesIO(file_content))
+            # Большой файл, занимающий несколько блоков чтения
+            file_content = "".join(f"строка {i}\n" for i in range(1, 2001)).encode("utf-8")
+            info = tarfile.TarInfo("./log.txt")
+            info.size = len(file_content)
+            tar.addfile(info, BytesIO(file_content))
+
     def setUp(self):
         # Инициализируем эмулятор с тестовым tar-архивом
         self.shell = ShellEmulator(TestShellEmulator.test_tar_path, "test_shell")
 
+    def tearDown(self):
+        self.shell.close()
+
+    def _open_shell(self, tar_path):
+        # Эмулятор, который будет закрыт после теста
+        shell = ShellEmulator(tar_path, "test_shell")
+        self.addCleanup(shell.close)
+        return shell
+
     def test_ls(self):
         # Тестируем вывод содержимого корневой директории
         output = self._capture_stdout(self.shell.ls)
@@ -128,6 +156,348 @@ class TestShellEmulator(unittest.TestCase):
         output = self._capture_stdout(lambda: self.shell.head("file1.txt"))
         self.assertIn("Contents of file1.txt", output)  # Проверяем, что содержимое есть в выводе
 
+    def test_ls_implicit_directory(self):
+        # Каталоги, которых нет в архиве явно, строятся по путям файлов
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        shell.cd("dir1")
+        output = self._capture_stdout(shell.ls)
+        self.assertEqual(output.strip(), "a.txt  sub")
+        self.assertEqual(shell.current_path, "/dir1")
+
+    def test_mv_directory_moves_children(self):
+        # Перемещение каталога переносит всё поддерево
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        self._capture_stdout(lambda: shell.mv("dir1", "moved"))
+        self.assertIn("./moved/sub/b.txt", shell.file_system)
+        self.assertNotIn("./dir1/sub/b.txt", shell.file_system)
+        output = self._capture_stdout(lambda: shell.cat("moved/sub/b.txt"))
+        self.assertIn("Contents of dir1/sub/b.txt", output)
+
+    def test_mv_directory_into_itself(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        output = self._capture_stdout(lambda: shell.mv("dir1", "dir1/sub"))
+        self.assertIn("subdirectory of itself", output)
+        self.assertIn("./dir1/sub/b.txt", shell.file_system)
+
+    def test_mkdir_missing_parent(self):
+        output = self._capture_stdout(lambda: self.shell.mkdir("missing/dir"))
+        self.assertIn("No such file or directory", output)
+        self.assertNotIn("./missing", self.shell.file_system)
+
+    def test_cat_does_not_reopen_archive(self):
+        # После загрузки чтение идёт через открытый архив, без повторного tarfile.open
+        with patch("tarfile.open", side_effect=AssertionError("archive reopened")):
+            output = self._capture_stdout(lambda: self.shell.cat("file2.txt"))
+        self.assertIn("Contents of file2.txt", output)
+
+    def test_cat_compressed_archive(self):
+        # Сжатый архив читается через тот же открытый TarFile
+        gz_path = "test_virtual_fs.tar.gz"
+        with tarfile.open(gz_path, "w:gz") as tar:
+            tar.add(TestShellEmulator.nested_tar_path, arcname="./inner.tar")
+            file_content = b"gzip line 1\ngzip line 2\n"
+            info = tarfile.TarInfo("./gz.txt")
+            info.size = len(file_content)
+            tar.addfile(info, BytesIO(file_content))
+        self.addCleanup(os.remove, gz_path)
+        self.addCleanup(os.remove, gz_path + ".idx")
+
+        shell = self._open_shell(gz_path)
+        output = self._capture_stdout(lambda: shell.cat("gz.txt"))
+        self.assertIn("gzip line 1\ngzip line 2", output)
+
+    def test_head_reads_only_needed_lines(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        output = self._capture_stdout(lambda: shell.head("log.txt", 3))
+        self.assertEqual(output.splitlines()[1:], ["строка 1", "строка 2", "строка 3"])
+
+    def test_tail(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        output = self._capture_stdout(lambda: shell.tail("log.txt", 3))
+        self.assertEqual(output.splitlines(), ["строка 1998", "строка 1999", "строка 2000"])
+
+    def test_tail_across_blocks(self):
+        # Маленький блок заставляет собирать строки из нескольких чтений
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        info = shell.file_system["./log.txt"]
+        lines = read_tail(shell.archive.open(info), 500, block_size=7)
+        self.assertEqual(lines[0], "строка 1501")
+        self.assertEqual(lines[-1], "строка 2000")
+        self.assertEqual(len(lines), 500)
+
+    def test_head_tail_negative_count(self):
+        # Отрицательное число строк — ошибка использования, а не исключение
+        for command in ("head", "tail"):
+            output = self._capture_stdout(lambda: self.shell.execute(f"{command} file1.txt -1"))
+            self.assertEqual(output.strip(), f"{command}: invalid number of lines: '-1'")
+        output = self._capture_stdout(lambda: self.shell.head("file1.txt", -1))
+        self.assertNotIn("Contents of file1.txt", output)
+
+    def test_tail_whole_file(self):
+        output = self._capture_stdout(lambda: self.shell.tail("file1.txt", 5))
+        self.assertEqual(output.strip(), "Contents of file1.txt")
+
+    def test_index_sidecar_reused(self):
+        # Второй запуск строит дерево по индексу-спутнику, не обходя заголовки архива
+        self._open_shell(TestShellEmulator.nested_tar_path).close()
+        self.assertTrue(os.path.exists(TestShellEmulator.nested_tar_path + ".idx"))
+
+        with patch.object(ArchiveReader, "members", side_effect=AssertionError("full scan")):
+            shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        self.assertIn("./dir1/sub/b.txt", shell.file_system)
+        output = self._capture_stdout(lambda: shell.cat("dir1/sub/b.txt"))
+        self.assertIn("Contents of dir1/sub/b.txt", output)
+
+    def test_index_sidecar_stale(self):
+        # Индекс, записанный для другого размера или mtime архива, не используется
+        self._open_shell(TestShellEmulator.nested_tar_path).close()
+        archive_stat = os.stat(TestShellEmulator.nested_tar_path)
+        index_path = TestShellEmulator.nested_tar_path + ".idx"
+        self.assertIsNotNone(load_index(index_path, archive_stat))
+
+        stale_stat = SimpleNamespace(st_size=archive_stat.st_size, st_mtime_ns=archive_stat.st_mtime_ns + 1)
+        self.assertIsNone(load_index(index_path, stale_stat))
+        self.assertIsNone(load_index("missing.idx", archive_stat))
+
+    def test_mv_keeps_base_tree(self):
+        # Переименование записывается в слой изменений, базовое дерево не меняется
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        self._capture_stdout(lambda: shell.mv("dir1", "moved"))
+        self.assertIn("./dir1/sub/b.txt", shell.base)
+        self.assertNotIn("./moved", shell.base)
+        # Поддерево не копируется: под новым именем тот же узел базового дерева
+        self.assertIs(shell.file_system.lookup("moved/sub"), shell.base.lookup("dir1/sub"))
+
+    def test_mkdir_and_touch_in_overlay(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        shell.mkdir("dir1/new")
+        shell.touch("dir1/new/empty.txt")
+        output = self._capture_stdout(lambda: (shell.cd("dir1"), shell.ls()))
+        self.assertEqual(output.strip(), "a.txt  new  sub")
+        self.assertIn("./dir1/new/empty.txt", shell.file_system)
+        self.assertNotIn("./dir1/new", shell.base)
+
+    def test_save_and_apply_delta(self):
+        # Изменения сессии сохраняются в небольшой архив и воспроизводятся в новой сессии
+        delta_path = "test_delta.tar"
+        self.addCleanup(os.remove, delta_path)
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        shell.mkdir("new")
+        shell.file_system.write_file(["new", "note.txt"], "заметка".encode("utf-8"))
+        self._capture_stdout(lambda: shell.mv("dir1", "new/dir1"))
+        output = self._capture_stdout(lambda: shell.save(delta_path))
+        self.assertIn("Saved 3 change(s)", output)
+
+        restored = self._open_shell(TestShellEmulator.nested_tar_path)
+        restored.file_system.apply_delta(delta_path)
+        self.assertIn("./new/dir1/sub/b.txt", restored.file_system)
+        self.assertNotIn("./dir1", restored.file_system)
+        output = self._capture_stdout(lambda: restored.cat("new/note.txt"))
+        self.assertIn("заметка", output)
+
+    def _make_compressed_archive(self, mode, count=12, size=32 * 1024):
+        # Архив из несжимаемых файлов, чтобы данные занимали много блоков распаковки
+        path = f"test_random.{mode}"
+        contents = {}
+        with tarfile.open(path, f"w:{mode}") as tar:
+            for i in range(count):
+                data = os.urandom(size)
+                info = tarfile.TarInfo(f"./blob{i}.bin")
+                info.size = len(data)
+                tar.addfile(info, BytesIO(data))
+                contents[info.name] = data
+        self.addCleanup(os.remove, path)
+        return path, contents
+
+    def test_gzip_random_access_uses_checkpoints(self):
+        path, contents = self._make_compressed_archive("gz")
+        reader = ArchiveReader(path, checkpoint_spacing=64 * 1024)
+        self.addCleanup(reader.close)
+        members = {member.name: member for member in reader.members()}
+        self.assertGreater(len(reader.stream._checkpoints), 3)
+
+        # Переход назад и к концу архива не распаковывает всё, что лежит перед членом
+        chunks = []
+        decompress_chunk = reader.stream._decompress_chunk
+        reader.stream._decompress_chunk = lambda: chunks.append(1) or decompress_chunk()
+        for name in ("./blob0.bin", "./blob11.bin", "./blob5.bin"):
+            self.assertEqual(reader.read(members[name]), contents[name])
+        self.assertLessEqual(len(chunks), 6)
+
+    def test_xz_and_bz2_archives(self):
+        for mode in ("xz", "bz2"):
+            path, contents = self._make_compressed_archive(mode, count=4)
+            reader = ArchiveReader(path)
+            self.addCleanup(reader.close)
+            members = {member.name: member for member in reader.members()}
+            for name in ("./blob3.bin", "./blob1.bin"):
+                self.assertEqual(reader.read(members[name], 100, 50), contents[name][100:150])
+
+    def test_run_script_report(self):
+        # Скрипт разбирается заранее, каждая команда попадает в отчёт со временем выполнения
+        script = ["# комментарий", "ls", "", "cat file1.txt", "unknown", "exit", "pwd"]
+        output = StringIO()
+        with patch("sys.stdout", output):
+            report = self.shell.run_script(script)
+        commands = [entry["command"] for entry in report["commands"]]
+        self.assertEqual(commands, ["ls", "cat file1.txt", "unknown", "exit"])
+        self.assertTrue(all(entry["seconds"] >= 0 for entry in report["commands"]))
+        self.assertIn("Contents of file1.txt", output.getvalue())
+        self.assertIn("unknown: command not found", output.getvalue())
+
+    def test_run_script_records_errors(self):
+        with patch.object(self.shell, "ls", side_effect=RuntimeError("boom")):
+            report = self.shell.run_script(["ls", "pwd"])
+        self.assertEqual(report["commands"][0]["error"], "RuntimeError: boom")
+        self.assertNotIn("error", report["commands"][1])
+
+    def test_execute_missing_operand(self):
+        output = self._capture_stdout(lambda: self.shell.execute("mv file1.txt"))
+        self.assertIn("mv: missing destination file operand", output)
+        output = self._capture_stdout(lambda: self.shell.execute("head file1.txt x"))
+        self.assertIn("invalid number of lines", output)
+
+    def test_find_by_name(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        output = self._capture_stdout(lambda: shell.execute("find / -name *.txt"))
+        self.assertEqual(output.splitlines(), ["/c.txt", "/dir1/a.txt", "/dir1/sub/b.txt", "/log.txt"])
+
+    def test_du_uses_header_sizes(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        # du не должен читать данные файлов
+        with patch.object(shell.archive, "open", side_effect=AssertionError("data read")):
+            output = self._capture_stdout(lambda: shell.du("dir1"))
+        sizes = {name: len(f"Contents of {name}") for name in ("dir1/a.txt", "dir1/sub/b.txt")}
+        self.assertEqual(output.splitlines(), [
+            f"{sizes['dir1/sub/b.txt']}\tdir1/sub",
+            f"{sum(sizes.values())}\tdir1",
+        ])
+
+    def test_grep_reads_in_offset_order(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        offsets = []
+        archive_open = shell.archive.open
+        shell.archive.open = lambda info: offsets.append(info.offset_data) or archive_open(info)
+        output = self._capture_stdout(lambda: shell.execute("grep -i contents|строка.200$ /"))
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(len(offsets), 4)
+        self.assertIn("/dir1/sub/b.txt:Contents of dir1/sub/b.txt", output)
+        self.assertIn("/log.txt:строка 200", output.splitlines())
+
+    def test_mount_loads_lazily(self):
+        # Архив под точкой монтирования не открывается, пока к нему не обратились
+        shell = ShellEmulator(TestShellEmulator.test_tar_path, "test_shell",
+                              mounts={"/mnt/nested": TestShellEmulator.nested_tar_path})
+        self.addCleanup(shell.close)
+        nested = shell.base.archives[1]
+        self.assertIsNone(nested.tree)
+        output = self._capture_stdout(shell.ls)
+        self.assertEqual(output.strip(), "file1.txt  file2.txt  mnt")
+        self.assertIsNone(nested.tree)
+
+        output = self._capture_stdout(lambda: shell.cat("/mnt/nested/dir1/sub/b.txt"))
+        self.assertIsNotNone(nested.tree)
+        self.assertIn("Contents of dir1/sub/b.txt", output)
+
+    def test_mount_broken_archive(self):
+        # Отсутствующий архив точки монтирования обнаруживается при запуске
+        with self.assertRaises(FileNotFoundError):
+            ShellEmulator(TestShellEmulator.test_tar_path, "test_shell", mounts={"/mnt/layer": "missing.tar"})
+
+        # Повреждённый архив не завершает сессию: ls сообщает об ошибке, изменения сохраняются
+        path = "test_broken_layer.tar"
+        with open(path, "wb") as file:
+            file.write(b"not a tar archive")
+        self.addCleanup(os.remove, path)
+        shell = ShellEmulator(TestShellEmulator.test_tar_path, "test_shell", mounts={"/mnt/layer": path})
+        self.addCleanup(shell.close)
+        shell.mkdir("kept")
+        shell.cd("/mnt/layer")
+        output = self._capture_stdout(shell.ls)
+        self.assertIn("ls: cannot access '/mnt/layer':", output)
+        self.assertIsNotNone(shell.base.root.mounts["mnt"].mounts["layer"].error)
+
+        # Исключение команды в интерактивном режиме выводится, и цикл продолжается
+        with patch("builtins.input", side_effect=["ls", "boom", "exit"]), \
+                patch.object(shell, "execute", side_effect=[True, RuntimeError("сбой"), False]):
+            output = self._capture_stdout(shell.run)
+        self.assertIn("boom: RuntimeError: сбой", output)
+        self.assertIn("./kept", shell.file_system)
+
+    def test_mount_inside_archive_directory(self):
+        # Точка монтирования внутри каталога архива дополняет его содержимое
+        shell = ShellEmulator(TestShellEmulator.nested_tar_path, "test_shell",
+                              mounts={"/dir1/extra": TestShellEmulator.test_tar_path})
+        self.addCleanup(shell.close)
+        shell.cd("dir1")
+        output = self._capture_stdout(shell.ls)
+        self.assertEqual(output.strip(), "a.txt  extra  sub")
+        output = self._capture_stdout(lambda: shell.execute("grep Contents /dir1"))
+        self.assertIn("/dir1/extra/file2.txt:Contents of file2.txt", output)
+        self.assertIn("/dir1/sub/b.txt:Contents of dir1/sub/b.txt", output)
+
+    def test_server_sessions_share_index(self):
+        # Две сессии сервера работают с одним деревом, но каждая со своей директорией и изменениями
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        server = ShellServer(shell.base, "test_shell", max_workers=2)
+        self.addCleanup(server.close)
+
+        async def session(port, commands):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write("".join(f"{command}\n" for command in commands).encode("utf-8"))
+            await writer.drain()
+            output = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            return output.decode("utf-8")
+
+        async def scenario():
+            listener = await server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                return await asyncio.gather(
+                    session(port, ["mkdir only_first", "cd dir1", "pwd", "ls", "exit"]),
+                    session(port, ["cd dir1/sub", "cat b.txt", "ls /", "save saved.tar", "exit"]),
+                )
+
+        first, second = asyncio.run(scenario())
+        self.assertIn("test_shell:/dir1$ /dir1\ntest_shell:/dir1$ a.txt  sub\n", first)
+        self.assertIn("Contents of dir1/sub/b.txt", second)
+        self.assertNotIn("only_first", second)
+        # Сохранение на стороне сервера клиентам недоступно
+        self.assertIn("save saved.tar: command not found", second)
+        self.assertFalse(os.path.exists("saved.tar"))
+        # Базовое дерево не изменилось, а архив загружен один раз
+        self.assertNotIn("./only_first", shell.base)
+        self.assertEqual(len(shell.base.archives), 1)
+
+    def test_compact_entries(self):
+        # Дерево хранит компактные записи без __dict__, а не полные TarInfo
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        entry = shell.file_system["./dir1/sub/b.txt"]
+        self.assertNotIsInstance(entry, tarfile.TarInfo)
+        self.assertFalse(hasattr(entry, "__dict__"))
+        self.assertEqual(entry.name, "b.txt")
+        self.assertEqual(entry.size, len("Contents of dir1/sub/b.txt"))
+        self.assertTrue(entry.isfile())
+        self.assertEqual(shell.archive.tar.members, [])
+
+    def test_entry_names_are_interned(self):
+        shell = self._open_shell(TestShellEmulator.nested_tar_path)
+        first = shell.base.lookup("dir1/sub").name
+        second = "".join(["s", "u", "b"])
+        self.assertIs(sys.intern(second), first)
+
+    def test_benchmark_smoke(self):
+        # Крошечный прогон бенчмарка: все формы, с сжатием и без
+        report = run_benchmark(["deep", "wide", "large"], ["none", "gz"], scale=0.001, repeat=3)
+        self.assertEqual(len(report["results"]), 6)
+        for result in report["results"]:
+            self.assertGreater(result["load"]["cold_seconds"], 0)
+            self.assertGreater(result["load"]["peak_bytes"], 0)
+            self.assertEqual(sorted(result["latency"]), ["cat", "cd", "head", "ls", "mv"])
+            self.assertEqual(result["latency"]["cat"]["count"], 3)
+
     # Вспомогательный метод для захвата вывода функций
     def _capture_stdout(self, func):
         import sys
@@ -144,8 +514,10 @@ class TestShellEmulator(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         # Удаляем временный tar-архив после тестов
-        if os.path.exists(cls.test_tar_path):
-            os.remove(cls.test_tar_path)
+        for path in (cls.test_tar_path, cls.nested_tar_path):
+            for file_path in (path, path + ".idx"):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,48 @@
 import argparse
+import bz2
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import lzma
+import os
+import re
+import shlex
+import sqlite3
 import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Число одновременных запросов apt-cache по умолчанию
+DEFAULT_JOBS = 8
+
+# Файл кэша зависимостей по умолчанию
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "graphviz_deps.sqlite3")
+
+# Метаданные apt, при изменении которых вывод apt-cache может стать другим
+APT_METADATA = ["/var/lib/apt/lists/*_Packages*", "/var/lib/dpkg/status"]
+
+# Виды зависимостей от самой сильной к самой слабой; apt-cache пишет PreDepends без дефиса
+DEPENDENCY_KINDS = ("Pre-Depends", "Depends", "Recommends", "Suggests")
+APT_CACHE_KINDS = {"PreDepends": "Pre-Depends", "Depends": "Depends",
+                   "Recommends": "Recommends", "Suggests": "Suggests"}
+DEFAULT_KINDS = ("Pre-Depends", "Depends")
+# Строка поля вывода apt-cache depends: "  |Depends: a". Двоеточие без пробела после
+# него — это архитектура поставщика ("libc6-dev:i386"), а не поле
+APT_CACHE_FIELD_RE = re.compile(r"^\|?(\w[\w-]*): (.*)$")
+
+# Вид ребра ко второй и следующим альтернативам "a | b" помечается префиксом, как в apt-cache
+ALTERNATIVE_MARK = "|"
+
+# Файлы визуализации изменившегося подграфа (--changed-only)
+CHANGES_SOURCE = "graph.changes.mmd"
+CHANGES_TARGET = "graph.changes.png"
+
+# Версия формата записей в кэше: при изменении разбора старые записи не используются
+CACHE_FORMAT = 2
 
 
 def parse_args():
@@ -9,19 +52,66 @@ def parse_args():
     parser.add_argument('-v', '--visualizer', required=True,
                         help="Путь к программе для визуализации графов (например, mmdc)")
 
-    # Имя пакета для анализа
-    parser.add_argument('-p', '--package', required=True, help="Имя анализируемого пакета")
+    # Имя пакета для анализа либо файл со списком корневых пакетов для пакетного режима
+    roots = parser.add_mutually_exclusive_group(required=True)
+    roots.add_argument('-p', '--package', help="Имя анализируемого пакета")
+    roots.add_argument('-b', '--batch',
+                       help="Файл со списком корневых пакетов, по одному в строке ('-' — стандартный ввод)")
+    # Какие связи между пакетами включать в граф
+    parser.add_argument('--follow', type=parse_kinds, default=DEFAULT_KINDS,
+                        help="Виды зависимостей через запятую: " + ", ".join(DEPENDENCY_KINDS)
+                             + " (по умолчанию " + ",".join(DEFAULT_KINDS) + ")")
+    parser.add_argument('--alternatives', choices=["first", "all"], default="first",
+                        help="Из группы альтернатив 'a | b' следовать только за первой или за всеми")
+    # Анализ построенного графа
+    parser.add_argument('--why', metavar='PACKAGE',
+                        help="Показать, какие корневые пакеты подтягивают указанный пакет")
+    parser.add_argument('--cycles', action='store_true', help="Показать циклы зависимостей")
+    parser.add_argument('--top', type=int, metavar='N',
+                        help="Показать N пакетов с наибольшим транзитивным замыканием")
+    # Повторная визуализация
+    parser.add_argument('--force', action='store_true',
+                        help="Перезаписать и визуализировать граф, даже если он не изменился")
+    parser.add_argument('--changed-only', action='store_true',
+                        help=f"Визуализировать только подграф, изменившийся с прошлого запуска ({CHANGES_TARGET})")
+    parser.add_argument('-f', '--format', choices=sorted(GRAPH_WRITERS), default="mermaid",
+                        help="Формат вывода графа (по умолчанию mermaid; визуализируется только mermaid)")
+    parser.add_argument('-o', '--output-dir', default="graphs",
+                        help="Каталог для подграфов каждого корня в пакетном режиме (по умолчанию graphs)")
 
     # Максимальная глубина анализа зависимостей
     parser.add_argument('-d', '--depth', type=int, default=3,
                         help="Максимальная глубина анализа зависимостей (по умолчанию 3)")
 
+    # Число одновременных запросов зависимостей
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f"Число одновременных запросов apt-cache (по умолчанию {DEFAULT_JOBS})")
+
     # URL репозитория для получения информации о зависимостях
-    parser.add_argument('-r', '--repo', required=True, help="URL-адрес репозитория для анализа")
+    # Локальный файл Packages или /var/lib/dpkg/status включает офлайн-режим без apt-cache
+    parser.add_argument('-r', '--repo', required=True,
+                        help="URL-адрес репозитория или путь к файлу Packages / dpkg status для офлайн-анализа")
+
+    # Постоянный кэш разобранных зависимостей
+    parser.add_argument('--cache', default=DEFAULT_CACHE,
+                        help=f"Файл кэша зависимостей (по умолчанию {DEFAULT_CACHE})")
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None,
+                        help="Не использовать кэш зависимостей")
 
     return parser.parse_args()
 
 
+def parse_kinds(value):
+    """
+    Разобрать список видов зависимостей для --follow: "Depends,Recommends".
+    """
+    kinds = tuple(kind.strip() for kind in value.split(",") if kind.strip())
+    unknown = [kind for kind in kinds if kind not in DEPENDENCY_KINDS]
+    if unknown or not kinds:
+        raise argparse.ArgumentTypeError(f"неизвестный вид зависимости: {', '.join(unknown) or value!r}")
+    return kinds
+
+
 def get_package_dependencies(package_name):
     """
     Получить зависимости для указанного пакета с помощью команды apt-cache.
@@ -40,89 +130,942 @@ def get_package_dependencies(package_name):
         return ""
 
 
+# Открытие файлов метаданных репозитория по расширению
+METADATA_OPENERS = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+    ".bz2": bz2.open,
+}
+
+
+def iter_stanzas(lines):
+    """
+    Разбить файл в формате Debian control на абзацы (словари поле -> значение).
+    """
+    stanza = {}
+    field = None
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            if stanza:
+                yield stanza
+            stanza, field = {}, None
+        elif line[0] in " \t":
+            # Строка-продолжение многострочного поля
+            if field is not None:
+                stanza[field] += "\n" + line.strip()
+        elif ":" in line:
+            field, value = line.split(":", 1)
+            stanza[field] = value.strip()
+    if stanza:
+        yield stanza
+
+
+def package_name(relation):
+    """
+    Имя пакета без ограничения версии и архитектуры: "libfoo:any (>= 1.0) [amd64]" -> "libfoo".
+    """
+    return relation.split("(")[0].split("[")[0].strip().split(":")[0]
+
+
+def parse_depends_field(value):
+    """
+    Разобрать поле зависимостей в группы альтернатив:
+    "libc6 (>= 2.34), libssl3 | libssl1.1" -> [['libc6'], ['libssl3', 'libssl1.1']].
+    """
+    groups = []
+    for group in value.split(","):
+        alternatives = [package_name(alternative) for alternative in group.split("|")]
+        alternatives = [name for name in alternatives if name]
+        if alternatives:
+            groups.append(alternatives)
+    return groups
+
+
+def load_package_index(path):
+    """
+    Один раз прочитать файл Packages (в том числе .gz/.xz/.bz2) или dpkg status
+    в словарь смежности: имя пакета -> список связей [вид, [альтернативы]].
+    Виртуальные пакеты из полей Provides заменяются пакетами, которые их предоставляют.
+    """
+    opener = METADATA_OPENERS.get(os.path.splitext(path)[1], open)
+    index = {}
+    providers = {}  # Виртуальный пакет -> пакеты, которые его предоставляют
+    with opener(path, "rt", encoding="utf-8", errors="replace") as file:
+        for stanza in iter_stanzas(file):
+            package = stanza.get("Package")
+            # В dpkg status пропускаем удалённые пакеты, от которых остались только настройки
+            status = stanza.get("Status")
+            if package is None or (status is not None and not status.endswith(" installed")):
+                continue
+            # Первая запись пакета (несколько версий в Packages) имеет приоритет
+            if package in index:
+                continue
+            index[package] = [[kind, alternatives] for kind in DEPENDENCY_KINDS
+                              for alternatives in parse_depends_field(stanza.get(kind, ""))]
+            for group in parse_depends_field(stanza.get("Provides", "")):
+                providers.setdefault(group[0], []).append(package)
+
+    for relations in index.values():
+        for relation in relations:
+            alternatives = []
+            for name in relation[1]:
+                alternatives.extend(providers.get(name, [name]) if name not in index else [name])
+            relation[1] = list(dict.fromkeys(alternatives))
+    return index
+
+
+class LazyPackageIndex:
+    """
+    Индекс load_package_index, который читается с диска только при первом промахе кэша.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self, package, default=None):
+        with self._lock:
+            if self._index is None:
+                self._index = load_package_index(self.path)
+        return self._index.get(package, default)
+
+
+def repository_fingerprint(repo):
+    """
+    Отпечаток метаданных репозитория: имя, размер и время изменения файлов.
+    Для локального файла — только он сам, иначе — списки пакетов apt.
+    """
+    if os.path.isfile(repo):
+        paths = [os.path.abspath(repo)]
+    else:
+        paths = sorted(path for pattern in APT_METADATA for path in glob.glob(pattern))
+    digest = hashlib.sha1(repo.encode("utf-8"))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"\n{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DependencyCache:
+    """
+    Кэш разобранных списков зависимостей в SQLite, ключ — (репозиторий, отпечаток, пакет).
+    Один файл кэша делят разные репозитории; при смене отпечатка метаданных удаляются
+    устаревшие записи только этого репозитория.
+    """
+
+    def __init__(self, path, repo, fingerprint):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.repo = repo
+        self.fingerprint = f"{CACHE_FORMAT}:{fingerprint}"
+        # Запись идёт из потоков пула, поэтому соединение общее и защищено блокировкой.
+        # Каждая запись фиксируется сразу (autocommit, журнал WAL), чтобы параллельные
+        # запуски не ждали блокировку записи весь обход
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(dependencies)")]
+            if columns and "repo" not in columns:
+                # Таблица старого формата без репозитория
+                self.connection.execute("DROP TABLE dependencies")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS dependencies ("
+                "repo TEXT NOT NULL, fingerprint TEXT NOT NULL, package TEXT NOT NULL, depends TEXT NOT NULL, "
+                "PRIMARY KEY (repo, fingerprint, package))")
+            self.connection.execute("DELETE FROM dependencies WHERE repo = ? AND fingerprint != ?",
+                                    (self.repo, self.fingerprint))
+
+    def get(self, package):
+        """
+        :return: Список связей или None, если пакета нет в кэше
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT depends FROM dependencies WHERE repo = ? AND fingerprint = ? AND package = ?",
+                (self.repo, self.fingerprint, package)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, package, dependencies):
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dependencies VALUES (?, ?, ?, ?)",
+                (self.repo, self.fingerprint, package, json.dumps(dependencies)))
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_relations(raw_dependencies):
+    """
+    Разобрать вывод apt-cache depends в список связей [вид, [альтернативы]].
+    Строка "|Depends: a" означает "a или следующая зависимость". Виртуальный пакет <v>
+    заменяется перечисленными под ним пакетами, а без них остаётся как "<v>".
+    """
+    relations = []
+    or_next = False  # Предыдущая зависимость продолжается альтернативой
+    virtual = None  # (группа, позиция) виртуального пакета, ожидающего список поставщиков
+    for line in raw_dependencies.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = APT_CACHE_FIELD_RE.match(line)
+        if match is None:
+            # Поставщик виртуального пакета (или имя самого пакета в первой строке вывода)
+            if virtual is not None:
+                group, position = virtual
+                if group[position].startswith("<"):
+                    group[position] = package_name(line)
+                else:
+                    position += 1
+                    group.insert(position, package_name(line))
+                virtual = (group, position)
+            continue
+
+        virtual = None
+        field, value = match.groups()
+        kind = APT_CACHE_KINDS.get(field)
+        if kind is None:
+            # Conflicts, Breaks, Replaces и т.п. не являются зависимостями
+            or_next = False
+            continue
+        if or_next and relations[-1][0] == kind:
+            group = relations[-1][1]
+        else:
+            group = []
+            relations.append([kind, group])
+        name = value.strip()
+        if name.startswith("<"):
+            group.append(f"<{package_name(name.strip('<>'))}>")
+            virtual = (group, len(group) - 1)
+        else:
+            group.append(package_name(name))
+        or_next = line.startswith("|")
+
+    for relation in relations:
+        relation[1] = list(dict.fromkeys(relation[1]))
+    return relations
+
+
 def parse_dependencies(raw_dependencies):
     """
     Разобрать вывод команды apt-cache в формат зависимостей.
+    Возвращает первые альтернативы всех Depends.
     """
     dependencies = []
-    for line in raw_dependencies.splitlines():
-        line = line.strip()
-        if line.startswith("Depends:"):
-            dep = line.split("Depends:")[1].strip()
+    for kind, alternatives in parse_relations(raw_dependencies):
+        if kind == "Depends":
             # Убираем символы < >, чтобы не было синтаксических ошибок в Mermaid
-            dep = dep.replace('<', '').replace('>', '')
-            dependencies.append(dep)
+            dependencies.append(alternatives[0].strip("<>"))
     return dependencies
 
 
-def build_dependency_graph(package_name, max_depth):
+def is_virtual(name):
+    # Виртуальный пакет без поставщиков: запрашивать его зависимости бессмысленно
+    return name.startswith("<")
+
+
+def select_dependencies(relations, kinds=DEFAULT_KINDS, alternatives="first"):
     """
-    Построить граф зависимостей пакета в формате Mermaid с учётом глубины.
+    Выбрать рёбра для обхода из списка связей.
+
+    :param kinds: Виды зависимостей, за которыми следует обход
+    :param alternatives: "first" — только первая альтернатива группы, "all" — все
+    :return: Список пар (зависимость, вид ребра); ребро к альтернативе помечено префиксом "|"
     """
-    visited = set()  # Для отслеживания посещённых пакетов
-    edges = []  # Для хранения рёбер графа
+    selected = []
+    for kind, names in relations:
+        if kind not in kinds:
+            continue
+        selected.append((names[0], kind))
+        if alternatives == "all":
+            selected.extend((name, ALTERNATIVE_MARK + kind) for name in names[1:])
+    return selected
 
-    def dfs(package, current_depth):
-        if current_depth > max_depth:
-            return
-        if package in visited:
-            return
-        visited.add(package)
 
+class DependencyResolver:
+    """
+    Обходит граф зависимостей по уровням, выполняя запросы одного уровня параллельно.
+    Каждый пакет запрашивается не более одного раза за время жизни объекта.
+    Если задан индекс из load_package_index, запросы к apt-cache не выполняются,
+    а при заданном DependencyCache сначала проверяется кэш.
+    Кэшируются все связи пакета, а kinds и alternatives лишь отбирают рёбра для обхода.
+    """
+
+    def __init__(self, jobs=DEFAULT_JOBS, index=None, cache=None, kinds=DEFAULT_KINDS, alternatives="first"):
+        self.index = index
+        self.cache = cache
+        self.kinds = kinds
+        self.alternatives = alternatives
+        self.executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+        self._futures = {}  # Имя пакета -> Future со списком связей
+        self._lock = threading.Lock()
+
+    def _lookup(self, package):
         raw_dependencies = get_package_dependencies(package)
-        dependencies = parse_dependencies(raw_dependencies)
+        dependencies = parse_relations(raw_dependencies)
+        # Пустой вывод означает ошибку apt-cache: его не кэшируем
+        if self.cache is not None and raw_dependencies:
+            self.cache.put(package, dependencies)
+        return dependencies
+
+    def _completed(self, dependencies):
+        future = Future()
+        future.set_result(dependencies)
+        return future
 
-        for dep in dependencies:
-            edges.append((package, dep))
-            dfs(dep, current_depth + 1)
+    def lookup(self, package):
+        """
+        Запустить (или переиспользовать) запрос зависимостей пакета.
 
-    # Построение графа начиная с указанного пакета
-    dfs(package_name, 1)
+        :return: Future со списком связей [вид, [альтернативы]]
+        """
+        with self._lock:
+            future = self._futures.get(package)
+            if future is None:
+                cached = self.cache.get(package) if self.cache is not None else None
+                if cached is not None:
+                    future = self._completed(cached)
+                elif self.index is not None:
+                    # Офлайн-индекс: поиск — обращение к словарю, поток не нужен
+                    dependencies = self.index.get(package, [])
+                    if self.cache is not None:
+                        self.cache.put(package, dependencies)
+                    future = self._completed(dependencies)
+                else:
+                    future = self.executor.submit(self._lookup, package)
+                self._futures[package] = future
+            return future
 
-    # Генерация Mermaid-графа
-    mermaid = ["graph TD"]
-    for parent, child in edges:
-        mermaid.append(f"  {parent} --> {child}")
-    return "\n".join(mermaid)
+    def resolve(self, package_name, max_depth):
+        """
+        Обход в ширину: все пакеты очередного уровня запрашиваются одновременно.
 
+        :return: DependencyGraph с рёбрами (родитель, зависимость)
+        """
+        return self.resolve_many([package_name], max_depth)
 
-def visualize_graph(visualizer, mermaid_code):
-    # Сохраняем код графа в файл
-    with open('graph.mmd', 'w') as file:
-        file.write(mermaid_code)
+    def resolve_many(self, roots, max_depth):
+        """
+        Общий обход в ширину от нескольких корней с одним множеством посещённых пакетов.
+        Каждый пакет раскрывается один раз на минимальной глубине от любого из корней.
+
+        :return: DependencyGraph объединённого графа
+        """
+        graph = DependencyGraph()
+        roots = list(dict.fromkeys(roots))
+        graph.roots = [graph.add_node(root) for root in roots]
+        visited = set(roots)
+        level = roots if max_depth >= 1 else []
+        for _ in range(max_depth):
+            futures = [(package, self.lookup(package)) for package in level]
+            level = []
+            for package, future in futures:
+                for dep, kind in select_dependencies(future.result(), self.kinds, self.alternatives):
+                    graph.add_edge(package, dep, kind)
+                    if dep not in visited and not is_virtual(dep):
+                        visited.add(dep)
+                        level.append(dep)
+        return graph
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DependencyGraph:
+    """
+    Граф зависимостей: пакеты нумеруются целыми числами, рёбра хранятся без повторов
+    в порядке добавления.
+    """
+
+    def __init__(self):
+        self.names = []  # Номер узла -> имя пакета
+        self.ids = {}  # Имя пакета -> номер узла
+        self.adjacency = []  # Номер узла -> упорядоченный словарь: номер зависимости -> вид ребра
+        self.roots = []  # Номера корневых пакетов, с которых начинался обход
+
+    def add_node(self, name):
+        """
+        :return: Номер узла (новый или существующий)
+        """
+        node = self.ids.get(name)
+        if node is None:
+            node = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.adjacency.append({})
+        return node
+
+    def add_edge(self, parent, child, kind="Depends"):
+        """
+        Добавить ребро parent -> child, повторное ребро игнорируется (сохраняется первый вид).
+        """
+        self.adjacency[self.add_node(parent)].setdefault(self.add_node(child), kind)
+
+    def edge_ids(self):
+        for parent, children in enumerate(self.adjacency):
+            for child in children:
+                yield parent, child
+
+    def edge_kinds(self):
+        for parent, children in enumerate(self.adjacency):
+            for child, kind in children.items():
+                yield parent, child, kind
+
+    def edges(self):
+        names = self.names
+        for parent, child in self.edge_ids():
+            yield names[parent], names[child]
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Восстановить граф из словаря в формате write_json.
+        """
+        graph = cls()
+        for name in data["nodes"]:
+            graph.add_node(name)
+        for parent, child, kind in data["edges"]:
+            graph.adjacency[parent].setdefault(child, kind)
+        return graph
+
+    def isolated(self):
+        """
+        Номера узлов без входящих и исходящих рёбер (например, корень без зависимостей).
+        """
+        linked = bytearray(len(self.names))
+        for parent, child in self.edge_ids():
+            linked[parent] = linked[child] = 1
+        return [node for node, flag in enumerate(linked) if not flag]
+
+    @property
+    def edge_count(self):
+        return sum(len(children) for children in self.adjacency)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+
+def strongly_connected_components(adjacency):
+    """
+    Итеративный алгоритм Тарьяна (без рекурсии, годится для глубоких графов).
+
+    :param adjacency: Список смежности по номерам узлов
+    :return: (номер компоненты каждого узла, список компонент в обратном топологическом порядке)
+    """
+    count = len(adjacency)
+    order = [-1] * count  # Порядковый номер посещения
+    low = [0] * count
+    on_stack = bytearray(count)
+    stack = []
+    component = [-1] * count
+    components = []
+    counter = 0
+    for start in range(count):
+        if order[start] != -1:
+            continue
+        order[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack[start] = 1
+        work = [(start, iter(adjacency[start]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if order[child] == -1:
+                    order[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = 1
+                    work.append((child, iter(adjacency[child])))
+                    break
+                if on_stack[child]:
+                    low[node] = min(low[node], order[child])
+            else:
+                # Все потомки узла обработаны
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component[member] = len(components)
+                        members.append(member)
+                        if member == node:
+                            break
+                    components.append(members)
+    return component, components
+
+
+class GraphAnalysis:
+    """
+    Запросы к построенному DependencyGraph: циклы, размеры транзитивных замыканий
+    и обратные зависимости. Граф конденсируется по компонентам сильной связности,
+    замыкания считаются один раз для каждой компоненты, а запоминаются только их размеры.
+    Требуется Python 3.10+ (int.bit_count).
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.component, self.components = strongly_connected_components(graph.adjacency)
+        self._closure_sizes = None
+        self._reverse = None
+
+    def _node(self, name):
+        node = self.graph.ids.get(name)
+        if node is None:
+            raise KeyError(f"пакет '{name}' отсутствует в графе")
+        return node
+
+    def closure_sizes(self):
+        """
+        Размеры транзитивных замыканий всех компонент (без самого пакета).
+        Компоненты Тарьяна идут от стоков к истокам, поэтому замыкания преемников
+        уже посчитаны к моменту обработки компоненты. Множество достижимых узлов
+        хранится битовой маской (int) только пока не обработаны все предшественники
+        компоненты, затем освобождается.
+        """
+        if self._closure_sizes is None:
+            adjacency, component = self.graph.adjacency, self.component
+            successors = []
+            waiting = [0] * len(self.components)  # Необработанные предшественники компоненты
+            for number, members in enumerate(self.components):
+                targets = {component[child] for member in members for child in adjacency[member]}
+                targets.discard(number)
+                successors.append(targets)
+                for target in targets:
+                    waiting[target] += 1
+
+            masks = {}
+            sizes = []
+            for number, members in enumerate(self.components):
+                mask = 0
+                for member in members:
+                    mask |= 1 << member
+                for successor in successors[number]:
+                    mask |= masks[successor]
+                    waiting[successor] -= 1
+                    if not waiting[successor]:
+                        del masks[successor]
+                sizes.append(mask.bit_count() - 1)
+                if waiting[number]:
+                    masks[number] = mask
+                successors[number] = None
+            self._closure_sizes = sizes
+        return self._closure_sizes
+
+    def closure_size(self, name):
+        """
+        :return: Число пакетов, которые транзитивно подтягивает пакет (без него самого)
+        """
+        return self.closure_sizes()[self.component[self._node(name)]]
+
+    def largest_closures(self, count=10):
+        """
+        :return: Список (пакет, размер замыкания) для count пакетов с наибольшим замыканием
+        """
+        names, closure_sizes = self.graph.names, self.closure_sizes()
+        sizes = [closure_sizes[number] for number in self.component]
+        top = heapq.nlargest(count, range(len(names)), key=sizes.__getitem__)
+        return [(names[node], sizes[node]) for node in top]
+
+    def cycles(self):
+        """
+        :return: Циклы зависимостей — компоненты сильной связности из нескольких пакетов
+                 или пакет, зависящий сам от себя
+        """
+        names, adjacency = self.graph.names, self.graph.adjacency
+        return [[names[member] for member in reversed(members)]
+                for members in self.components
+                if len(members) > 1 or members[0] in adjacency[members[0]]]
+
+    def dependents(self, name):
+        """
+        :return: Множество номеров всех пакетов, транзитивно зависящих от пакета
+        """
+        if self._reverse is None:
+            self._reverse = [[] for _ in self.graph.names]
+            for parent, child in self.graph.edge_ids():
+                self._reverse[child].append(parent)
+        start = self._node(name)
+        seen = {start}
+        queue = [start]
+        for node in queue:
+            for parent in self._reverse[node]:
+                if parent not in seen:
+                    seen.add(parent)
+                    queue.append(parent)
+        seen.discard(start)
+        return seen
+
+    def pulled_in_by(self, name):
+        """
+        :return: Корневые пакеты, которые транзитивно подтягивают пакет
+        """
+        dependents = self.dependents(name)
+        return [self.graph.names[root] for root in self.graph.roots if root in dependents]
+
+
+# Имена, которые Mermaid принимает как идентификатор узла без кавычек
+MERMAID_SAFE_NAME = re.compile(r"[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_])?")
+# Идентификаторы экранированных узлов: в именах пакетов Debian "_" не встречается,
+# а совпадающее имя из другого источника само экранируется
+MERMAID_NODE_ID = re.compile(r"n_\d+")
+MERMAID_KEYWORDS = {"end", "graph", "subgraph", "flowchart", "style", "class", "classdef",
+                    "click", "linkstyle", "direction", "default", "call", "href"}
+
+# Оформление рёбер по видам зависимостей
+MERMAID_ARROWS = {"Pre-Depends": "==>", "Depends": "-->", "Recommends": "-.->", "Suggests": "-.->"}
+DOT_STYLES = {"Pre-Depends": "bold", "Depends": None, "Recommends": "dashed", "Suggests": "dotted"}
+
+
+def mermaid_arrow(kind):
+    alternative = kind.startswith(ALTERNATIVE_MARK)
+    kind = kind.lstrip(ALTERNATIVE_MARK)
+    labels = [label for label, flag in (("or", alternative), ("suggests", kind == "Suggests")) if flag]
+    arrow = MERMAID_ARROWS[kind]
+    return f"{arrow}|{' '.join(labels)}|" if labels else arrow
+
+
+def dot_attributes(kind):
+    attributes = []
+    style = DOT_STYLES[kind.lstrip(ALTERNATIVE_MARK)]
+    if style:
+        attributes.append(f"style={style}")
+    if kind.startswith(ALTERNATIVE_MARK):
+        attributes.append('label="or"')
+    return f" [{', '.join(attributes)}]" if attributes else ""
+
+
+def write_mermaid(graph, file):
+    """
+    Записать граф в формате Mermaid построчно. Имена, недопустимые для Mermaid,
+    заменяются идентификатором n_<номер> с подписью ["имя"] при первом упоминании.
+    """
+    labels = []
+    for name in graph.names:
+        if MERMAID_SAFE_NAME.fullmatch(name) and name.lower() not in MERMAID_KEYWORDS \
+                and not MERMAID_NODE_ID.fullmatch(name):
+            labels.append(name)
+        else:
+            labels.append(None)
+    declared = bytearray(len(graph))
+
+    def node_ref(node):
+        if labels[node] is not None:
+            return labels[node]
+        if declared[node]:
+            return f"n_{node}"
+        declared[node] = 1
+        label = graph.names[node].replace('"', "#quot;").replace("<", "#lt;").replace(">", "#gt;")
+        return f'n_{node}["{label}"]'
+
+    arrows = {}
+    file.write("graph TD")
+    for parent, child, kind in graph.edge_kinds():
+        arrow = arrows.get(kind) or arrows.setdefault(kind, mermaid_arrow(kind))
+        file.write(f"\n  {node_ref(parent)} {arrow} {node_ref(child)}")
+    for node in graph.isolated():
+        file.write(f"\n  {node_ref(node)}")
+
+
+def _dot_quote(name):
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_dot(graph, file):
+    """
+    Записать граф в формате Graphviz DOT построчно.
+    """
+    names = [_dot_quote(name) for name in graph.names]
+    file.write("digraph dependencies {\n")
+    attributes = {}
+    for parent, child, kind in graph.edge_kinds():
+        attribute = attributes.get(kind)
+        if attribute is None:
+            attribute = attributes[kind] = dot_attributes(kind)
+        file.write(f"  {names[parent]} -> {names[child]}{attribute};\n")
+    for node in graph.isolated():
+        file.write(f"  {names[node]};\n")
+    file.write("}\n")
+
+
+def write_json(graph, file):
+    """
+    Записать граф в JSON: {"nodes": [имена], "edges": [[номер родителя, номер зависимости, вид], ...]}.
+    """
+    file.write('{"nodes": [')
+    for node, name in enumerate(graph.names):
+        file.write((", " if node else "") + json.dumps(name, ensure_ascii=False))
+    file.write('], "edges": [')
+    for number, (parent, child, kind) in enumerate(graph.edge_kinds()):
+        file.write(f"{', ' if number else ''}[{parent}, {child}, {json.dumps(kind)}]")
+    file.write("]}\n")
+
+
+# Форматы вывода: функция записи и расширение файла
+GRAPH_WRITERS = {
+    "mermaid": (write_mermaid, ".mmd"),
+    "dot": (write_dot, ".dot"),
+    "json": (write_json, ".json"),
+}
+
+
+class DigestWriter:
+    """
+    Файлоподобный объект, который не хранит текст, а только считает его SHA-256.
+    """
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def write(self, text):
+        self.digest.update(text.encode("utf-8"))
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def graph_digest(graph, write_graph=write_mermaid):
+    """
+    Отпечаток содержимого графа в заданном формате без сборки текста в памяти.
+    """
+    writer = DigestWriter()
+    write_graph(graph, writer)
+    return writer.hexdigest()
+
+
+def load_render_state(path):
+    """
+    Прочитать состояние прошлого запуска.
+
+    :return: (отпечаток, DependencyGraph) или None, если состояния нет или оно повреждено
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            state = json.load(file)
+        return state["digest"], DependencyGraph.from_json(state["graph"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_render_state(path, digest, graph):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f'{{"digest": "{digest}", "graph": ')
+        write_json(graph, file)
+        file.write("}\n")
+
+
+def changed_subgraph(previous, graph):
+    """
+    Подграф изменений: пакеты, у которых появились или пропали рёбра либо которые
+    появились впервые, вместе со всеми рёбрами текущего графа, касающимися этих пакетов.
+    """
+    old_edges = {(previous.names[parent], previous.names[child], kind)
+                 for parent, child, kind in previous.edge_kinds()}
+    new_edges = {(graph.names[parent], graph.names[child], kind)
+                 for parent, child, kind in graph.edge_kinds()}
+    changed = {name for name in graph.names if name not in previous}
+    for parent, child, _ in old_edges ^ new_edges:
+        changed.update((parent, child))
+
+    subgraph = DependencyGraph()
+    for parent, child, kind in graph.edge_kinds():
+        if graph.names[parent] in changed or graph.names[child] in changed:
+            subgraph.add_edge(graph.names[parent], graph.names[child], kind)
+    for name in graph.names:
+        if name in changed:
+            subgraph.add_node(name)
+    return subgraph
+
+
+def to_mermaid(graph):
+    """
+    Сгенерировать Mermaid-код графа в виде строки.
+    """
+    buffer = io.StringIO()
+    write_mermaid(graph, buffer)
+    return buffer.getvalue()
+
+
+def build_dependency_graph(package_name, max_depth, jobs=DEFAULT_JOBS, index=None, cache=None, **options):
+    """
+    Построить граф зависимостей пакета в формате Mermaid с учётом глубины.
+    """
+    return to_mermaid(resolve_dependency_graph(package_name, max_depth, jobs, index, cache, **options))
+
+
+def resolve_dependency_graph(package_name, max_depth, jobs=DEFAULT_JOBS, index=None, cache=None, **options):
+    """
+    Построить DependencyGraph пакета с учётом глубины.
+    Дополнительные параметры (kinds, alternatives) передаются в DependencyResolver.
+    """
+    with DependencyResolver(jobs, index, cache, **options) as resolver:
+        return resolver.resolve(package_name, max_depth)
+
+
+def build_batch_graphs(roots, max_depth, jobs=DEFAULT_JOBS, index=None, cache=None, **options):
+    """
+    Построить объединённый граф для списка корней за один обход и подграф каждого корня.
+    Подграфы собираются из уже полученных зависимостей, без повторных запросов.
+
+    :return: (DependencyGraph объединённого графа, словарь корень -> DependencyGraph подграфа)
+    """
+    with DependencyResolver(jobs, index, cache, **options) as resolver:
+        combined = resolver.resolve_many(roots, max_depth)
+        subgraphs = {root: resolver.resolve(root, max_depth) for root in dict.fromkeys(roots)}
+    return combined, subgraphs
+
+
+def read_roots(path):
+    """
+    Прочитать список корневых пакетов: по одному в строке, пустые строки и # комментарии пропускаются.
+    """
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as file:
+        lines = [line.split("#")[0].strip() for line in file]
+    return [line for line in lines if line]
+
+
+def print_analysis(analysis, args):
+    """
+    Вывести результаты запросов --why, --cycles и --top.
+    """
+    if args.why:
+        if args.why in analysis.graph:
+            roots = analysis.pulled_in_by(args.why)
+            print(f"Пакет {args.why} подтягивают: {', '.join(roots) if roots else 'ни один корневой пакет'}")
+        else:
+            print(f"Пакет {args.why} отсутствует в графе")
+    if args.cycles:
+        cycles = analysis.cycles()
+        print(f"Циклов зависимостей: {len(cycles)}")
+        for cycle in cycles:
+            print("  " + ", ".join(cycle))
+    if args.top:
+        print("Пакеты с наибольшим транзитивным замыканием:")
+        for name, size in analysis.largest_closures(args.top):
+            print(f"  {name}: {size}")
+
+
+def visualize_graph(visualizer, mermaid_code=None, source='graph.mmd', target='graph.png'):
+    # Сохраняем код графа в файл; None — файл уже записан потоково
+    if mermaid_code is not None:
+        with open(source, 'w') as file:
+            file.write(mermaid_code)
 
     # Визуализируем граф с помощью внешней программы (например, mmdc)
     print(f"Визуализация графа с помощью {visualizer}")
-    command = f"{visualizer} -i graph.mmd -o graph.png"
-    subprocess.run(command, shell=True)
+    # Список аргументов без оболочки: пути с пробелами и спецсимволами передаются как есть
+    command = shlex.split(visualizer) + ["-i", source, "-o", target]
+    return subprocess.run(command)
 
 
 def main():
     args = parse_args()
 
     package_name = args.package
-    print(f"Получение зависимостей для пакета: {package_name}")
+    if package_name is not None:
+        print(f"Получение зависимостей для пакета: {package_name}")
 
+    cache = None
     try:
-        # Генерация графа зависимостей с учётом глубины
-        mermaid_code = build_dependency_graph(package_name, args.depth)
+        # Локальные метаданные репозитория читаются один раз и только при промахе кэша,
+        # apt-cache не вызывается
+        index = LazyPackageIndex(args.repo) if os.path.isfile(args.repo) else None
+        if args.cache:
+            repo = os.path.abspath(args.repo) if os.path.isfile(args.repo) else args.repo
+            cache = DependencyCache(args.cache, repo, repository_fingerprint(args.repo))
+
+        write_graph, extension = GRAPH_WRITERS[args.format]
+        options = {"kinds": args.follow, "alternatives": args.alternatives}
+        if args.batch is not None:
+            # Пакетный режим: один обход для всех корней, подграфы — в отдельные файлы
+            roots = read_roots(args.batch)
+            print(f"Получение зависимостей для {len(roots)} пакетов")
+            graph, subgraphs = build_batch_graphs(roots, args.depth, args.jobs, index, cache, **options)
+            os.makedirs(args.output_dir, exist_ok=True)
+            for root, subgraph in subgraphs.items():
+                with open(os.path.join(args.output_dir, f"{root}{extension}"), "w") as file:
+                    write_graph(subgraph, file)
+            print(f"Подграфы {len(subgraphs)} пакетов сохранены в каталоге '{args.output_dir}'.")
+        else:
+            # Генерация графа зависимостей с учётом глубины
+            graph = resolve_dependency_graph(package_name, args.depth, args.jobs, index, cache, **options)
+
+            if args.format == "mermaid":
+                # Печать кода Mermaid в терминал
+                print("Сгенерированный код Mermaid:")
+                write_mermaid(graph, sys.stdout)
+                print()
+        print(f"Узлов: {len(graph)}, рёбер: {graph.edge_count}")
+        if args.why or args.cycles or args.top:
+            print_analysis(GraphAnalysis(graph), args)
 
-        # Печать кода Mermaid в терминал
-        print("Сгенерированный код Mermaid:")
-        print(mermaid_code)
+        # Неизменившийся граф не перезаписывается и не визуализируется повторно
+        output_file = f"graph{extension}"
+        state_file = f"{output_file}.state.json"
+        digest = graph_digest(graph, write_graph)
+        previous = load_render_state(state_file)
+        rendered = args.format != "mermaid" or os.path.exists("graph.png")
+        if not args.force and previous is not None and previous[0] == digest \
+                and os.path.exists(output_file) and rendered:
+            print(f"Граф не изменился, файл '{output_file}' и визуализация пропущены.")
+            return
 
-        # Сохранение графа в файл
-        output_file = "graph.mmd"
+        # Сохранение графа в файл потоково, без сборки всего текста в памяти
         with open(output_file, "w") as file:
-            file.write(mermaid_code)
+            write_graph(graph, file)
         print(f"Граф зависимостей сохранён в файле '{output_file}'.")
-        print("Откройте его в Mermaid Live Editor: https://mermaid-js.github.io/mermaid-live-editor/")
 
-        # Визуализируем граф
-        visualize_graph(args.visualizer, mermaid_code)
+        result = None
+        if args.format == "mermaid":
+            print("Откройте его в Mermaid Live Editor: https://mermaid-js.github.io/mermaid-live-editor/")
+            if args.changed_only and previous is not None:
+                # Визуализируем только изменившуюся часть большого графа
+                subgraph = changed_subgraph(previous[1], graph)
+                print(f"Изменившийся подграф: узлов {len(subgraph)}, рёбер {subgraph.edge_count}")
+                with open(CHANGES_SOURCE, "w") as file:
+                    write_mermaid(subgraph, file)
+                result = visualize_graph(args.visualizer, source=CHANGES_SOURCE, target=CHANGES_TARGET)
+            else:
+                # Визуализируем граф
+                result = visualize_graph(args.visualizer)
+
+        # Состояние запоминается только после успешной визуализации. Отпечаток охраняет
+        # graph.png, поэтому после визуализации одного подграфа изменений остаётся прежним:
+        # следующий обычный запуск перерисует полный граф
+        if result is None or result.returncode == 0:
+            if args.changed_only and previous is not None and args.format == "mermaid":
+                digest = previous[0]
+            save_render_state(state_file, digest, graph)
 
     except Exception as e:
         print(f"Произошла ошибка: {e}")
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == "__main__":
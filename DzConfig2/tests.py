@@ -3,10 +3,18 @@ from unittest.mock import patch, MagicMock
 import subprocess
 from io import StringIO
 import sys
+import threading
+import gzip
+import os
+import tempfile
+import json
 
 
 # Импортируем функции из вашего кода
-from graphviz import parse_args, get_package_dependencies, parse_dependencies, build_dependency_graph, visualize_graph
+from graphviz import parse_args, get_package_dependencies, parse_dependencies, build_dependency_graph, visualize_graph, \
+    load_package_index, DependencyCache, repository_fingerprint, build_batch_graphs, \
+    to_mermaid, DependencyGraph, write_mermaid, write_dot, write_json, parse_relations, \
+    GraphAnalysis, graph_digest, changed_subgraph, save_render_state, load_render_state, main
 
 
 class TestDependencyAnalyzer(unittest.TestCase):
@@ -58,7 +66,7 @@ class TestDependencyAnalyzer(unittest.TestCase):
         visualize_graph("mmdc", mermaid_code)
 
         # Проверка, что команда subprocess была вызвана
-        mock_subprocess.assert_called_with("mmdc -i graph.mmd -o graph.png", shell=True)
+        mock_subprocess.assert_called_with(["mmdc", "-i", "graph.mmd", "-o", "graph.png"])
 
         # Проверка, что граф был сохранён в файл
         mock_open.assert_called_with('graph.mmd', 'w')
@@ -93,6 +101,355 @@ class TestDependencyAnalyzer(unittest.TestCase):
         self.assertIn("graph TD", mermaid_code)
         self.assertNotIn("curl -->", mermaid_code)
 
+    @patch('subprocess.run')
+    def test_build_dependency_graph_shares_lookups(self, mock_run):
+        # Ромб a -> b, c -> d: пакет d должен запрашиваться один раз
+        graph = {"a": ["b", "c"], "b": ["d"], "c": ["d"], "d": []}
+        mock_run.side_effect = lambda args, **kwargs: MagicMock(
+            stdout="\n".join(f"Depends: {dep}" for dep in graph[args[2]]), stderr='', returncode=0)
+
+        mermaid_code = build_dependency_graph("a", 3)
+        self.assertIn("b --> d", mermaid_code)
+        self.assertIn("c --> d", mermaid_code)
+        looked_up = [call.args[0][2] for call in mock_run.call_args_list]
+        self.assertEqual(sorted(looked_up), ["a", "b", "c", "d"])
+
+    @patch('subprocess.run')
+    def test_build_dependency_graph_level_is_concurrent(self, mock_run):
+        # b и c находятся на одном уровне: их запросы должны выполняться одновременно
+        barrier = threading.Barrier(2, timeout=5)
+
+        def run(args, **kwargs):
+            if args[2] == "a":
+                return MagicMock(stdout="Depends: b\nDepends: c", stderr='', returncode=0)
+            barrier.wait()
+            return MagicMock(stdout="", stderr='', returncode=0)
+
+        mock_run.side_effect = run
+        mermaid_code = build_dependency_graph("a", 2, jobs=2)
+        self.assertIn("a --> b", mermaid_code)
+        self.assertFalse(barrier.broken)
+
+    def _write_packages(self, content, suffix=""):
+        # Временный файл метаданных репозитория
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with (gzip.open if suffix == ".gz" else open)(path, "wt", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def test_load_package_index(self):
+        path = self._write_packages(
+            "Package: curl\n"
+            "Version: 7.81.0\n"
+            "Depends: libc6 (>= 2.34), libcurl4 (= 7.81.0),\n"
+            " zlib1g | zlib-ng:any\n"
+            "Description: tool\n"
+            " multi-line description\n"
+            "\n"
+            "Package: libcurl4\n"
+            "Depends: libc6\n"
+            "\n"
+            "Package: libc6\n", suffix=".gz")
+        index = load_package_index(path)
+        self.assertEqual(index["curl"], [["Depends", ["libc6"]], ["Depends", ["libcurl4"]],
+                                         ["Depends", ["zlib1g", "zlib-ng"]]])
+        self.assertEqual(index["libcurl4"], [["Depends", ["libc6"]]])
+        self.assertEqual(index["libc6"], [])
+
+    def test_load_dpkg_status_skips_removed(self):
+        path = self._write_packages(
+            "Package: curl\nStatus: install ok installed\nDepends: libcurl4\n\n"
+            "Package: old\nStatus: deinstall ok config-files\nDepends: libc6\n")
+        self.assertEqual(load_package_index(path), {"curl": [["Depends", ["libcurl4"]]]})
+
+    @patch('subprocess.run')
+    def test_build_dependency_graph_offline(self, mock_run):
+        index = {"curl": [["Depends", ["libcurl4"]], ["Depends", ["libc6"]]],
+                 "libcurl4": [["Depends", ["libc6"]]], "libc6": []}
+        mermaid_code = build_dependency_graph("curl", 3, index=index)
+        self.assertIn("curl --> libcurl4", mermaid_code)
+        self.assertIn("libcurl4 --> libc6", mermaid_code)
+        mock_run.assert_not_called()
+
+    @patch('subprocess.run')
+    def test_dependency_cache_skips_lookups(self, mock_run):
+        mock_run.return_value = MagicMock(stdout="curl\n  Depends: libcurl4", stderr='', returncode=0)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "deps.sqlite3")
+
+        with DependencyCache(path, "repoA", "v1") as cache:
+            first = build_dependency_graph("curl", 1, cache=cache)
+        mock_run.reset_mock()
+        with DependencyCache(path, "repoA", "v1") as cache:
+            second = build_dependency_graph("curl", 1, cache=cache)
+        self.assertEqual(first, second)
+        mock_run.assert_not_called()
+
+        # Новый отпечаток метаданных делает кэш недействительным
+        with DependencyCache(path, "repoA", "v2") as cache:
+            self.assertIsNone(cache.get("curl"))
+            build_dependency_graph("curl", 1, cache=cache)
+        mock_run.assert_called_once()
+
+        # Другой репозиторий в том же файле не удаляет записи первого
+        with DependencyCache(path, "repoB", "v1") as cache:
+            cache.put("curl", [])
+        with DependencyCache(path, "repoA", "v2") as cache:
+            self.assertIsNotNone(cache.get("curl"))
+
+        # Записи фиксируются сразу: второе соединение пишет, пока первое открыто
+        with DependencyCache(path, "repoA", "v2") as first, DependencyCache(path, "repoB", "v1") as second:
+            first.put("wget", [])
+            second.put("wget", [])
+            self.assertEqual(second.get("wget"), [])
+
+    @patch('subprocess.run')
+    def test_dependency_cache_ignores_failures(self, mock_run):
+        mock_run.side_effect = subprocess.CalledProcessError(1, 'apt-cache', 'Error occurred')
+        with DependencyCache(":memory:", "repoA", "v1") as cache:
+            build_dependency_graph("curl", 1, cache=cache)
+            self.assertIsNone(cache.get("curl"))
+
+    def test_repository_fingerprint_tracks_file(self):
+        path = self._write_packages("Package: curl\n")
+        before = repository_fingerprint(path)
+        self.assertEqual(before, repository_fingerprint(path))
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("Depends: libcurl4\n")
+        self.assertNotEqual(before, repository_fingerprint(path))
+
+    @patch('subprocess.run')
+    def test_build_batch_graphs_shares_traversal(self, mock_run):
+        # Общая база libc6 запрашивается один раз для всех корней
+        graph = {"curl": ["libcurl4"], "wget": ["libc6"], "libcurl4": ["libc6"], "libc6": []}
+        mock_run.side_effect = lambda args, **kwargs: MagicMock(
+            stdout="\n".join(f"Depends: {dep}" for dep in graph[args[2]]), stderr='', returncode=0)
+
+        combined, subgraphs = build_batch_graphs(["curl", "wget", "curl"], 3)
+        looked_up = [call.args[0][2] for call in mock_run.call_args_list]
+        self.assertEqual(sorted(looked_up), ["curl", "libc6", "libcurl4", "wget"])
+        self.assertEqual(sorted(subgraphs), ["curl", "wget"])
+        self.assertIn("curl --> libcurl4", to_mermaid(combined))
+        self.assertEqual(to_mermaid(subgraphs["curl"]), "graph TD\n  curl --> libcurl4\n  libcurl4 --> libc6")
+        self.assertEqual(to_mermaid(subgraphs["wget"]), "graph TD\n  wget --> libc6")
+
+    def test_parse_args_batch(self):
+        test_args = ['graphviz.py', '-v', 'mmdc', '-b', 'roots.txt', '-r', 'Packages']
+        with patch.object(sys, 'argv', test_args):
+            args = parse_args()
+            self.assertIsNone(args.package)
+            self.assertEqual(args.batch, 'roots.txt')
+
+    def test_dependency_graph_deduplicates_edges(self):
+        graph = DependencyGraph()
+        graph.add_edge("curl", "libc6")
+        graph.add_edge("curl", "libc6")
+        graph.add_edge("libcurl4", "libc6")
+        graph.add_node("lonely")
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.edge_count, 2)
+        self.assertEqual(list(graph.edges()), [("curl", "libc6"), ("libcurl4", "libc6")])
+        self.assertEqual(graph.isolated(), [graph.ids["lonely"]])
+
+    def test_write_mermaid_escapes_names(self):
+        graph = DependencyGraph()
+        graph.add_edge("g++", "libstdc++6")
+        graph.add_edge("g++", "end")
+        graph.add_edge("cpp", "libstdc++6")
+        output = StringIO()
+        write_mermaid(graph, output)
+        self.assertEqual(output.getvalue(),
+                         'graph TD\n  n_0["g++"] --> n_1["libstdc++6"]\n  n_0 --> n_2["end"]\n  cpp --> n_1')
+
+        # Пакет с именем вида n<номер> не совпадает с идентификатором экранированного узла
+        graph = DependencyGraph()
+        graph.add_edge("g++", "n0")
+        graph.add_edge("n_1", "n0")
+        output = StringIO()
+        write_mermaid(graph, output)
+        self.assertEqual(output.getvalue(), 'graph TD\n  n_0["g++"] --> n0\n  n_2["n_1"] --> n0')
+
+    def test_write_dot_and_json(self):
+        graph = DependencyGraph()
+        graph.add_edge("curl", 'odd"name')
+        graph.add_node("lonely")
+        output = StringIO()
+        write_dot(graph, output)
+        self.assertEqual(output.getvalue(),
+                         'digraph dependencies {\n  "curl" -> "odd\\"name";\n  "lonely";\n}\n')
+        output = StringIO()
+        write_json(graph, output)
+        self.assertEqual(json.loads(output.getvalue()),
+                         {"nodes": ["curl", 'odd"name', "lonely"], "edges": [[0, 1, "Depends"]]})
+
+    def test_parse_relations(self):
+        raw = ("curl\n"
+               "  PreDepends: dpkg\n"
+               " |Depends: libssl3\n"
+               "  Depends: libssl1.1\n"
+               "  Depends: <mail-transport-agent>\n"
+               "    exim4\n"
+               "    postfix\n"
+               "  Depends: <perlapi>\n"
+               "  Depends: <libc-dev>\n"
+               "    libc6-dev:i386\n"
+               "    libc6-dev\n"
+               "    musl-dev\n"
+               "  Recommends: ca-certificates\n"
+               "  Breaks: old-curl\n"
+               "  Suggests: python3:any\n")
+        self.assertEqual(parse_relations(raw), [
+            ["Pre-Depends", ["dpkg"]],
+            ["Depends", ["libssl3", "libssl1.1"]],
+            ["Depends", ["exim4", "postfix"]],
+            ["Depends", ["<perlapi>"]],
+            ["Depends", ["libc6-dev", "musl-dev"]],
+            ["Recommends", ["ca-certificates"]],
+            ["Suggests", ["python3"]],
+        ])
+        # Прежний формат: первые альтернативы Depends без угловых скобок
+        self.assertEqual(parse_dependencies(raw), ["libssl3", "exim4", "perlapi", "libc6-dev"])
+
+    def test_load_package_index_resolves_provides(self):
+        path = self._write_packages(
+            "Package: mutt\nDepends: mail-transport-agent | sendmail\nRecommends: less\n\n"
+            "Package: exim4\nProvides: mail-transport-agent\n\n"
+            "Package: postfix\nProvides: mail-transport-agent (= 1.0)\n")
+        index = load_package_index(path)
+        self.assertEqual(index["mutt"], [["Depends", ["exim4", "postfix", "sendmail"]], ["Recommends", ["less"]]])
+
+    def test_build_dependency_graph_follow_options(self):
+        index = {"mutt": [["Pre-Depends", ["dpkg"]], ["Depends", ["exim4", "postfix"]],
+                          ["Recommends", ["less"]], ["Depends", ["<perlapi>"]]],
+                 "exim4": [["Depends", ["libc6"]]]}
+        mermaid_code = build_dependency_graph("mutt", 2, index=index)
+        self.assertIn("mutt ==> dpkg", mermaid_code)
+        self.assertIn("mutt --> exim4", mermaid_code)
+        self.assertIn("exim4 --> libc6", mermaid_code)
+        self.assertNotIn("postfix", mermaid_code)
+        self.assertNotIn("less", mermaid_code)
+
+        mermaid_code = build_dependency_graph("mutt", 1, index=index,
+                                              kinds=("Recommends", "Depends"), alternatives="all")
+        self.assertIn("mutt -->|or| postfix", mermaid_code)
+        self.assertIn("mutt -.-> less", mermaid_code)
+        self.assertIn('mutt --> n_4["#lt;perlapi#gt;"]', mermaid_code)
+        self.assertNotIn("dpkg", mermaid_code)
+
+    @patch('subprocess.run')
+    def test_virtual_packages_are_not_looked_up(self, mock_run):
+        mock_run.return_value = MagicMock(stdout="mutt\n  Depends: <perlapi>", stderr='', returncode=0)
+        build_dependency_graph("mutt", 3)
+        self.assertEqual([call.args[0][2] for call in mock_run.call_args_list], ["mutt"])
+
+    def test_parse_args_follow(self):
+        test_args = ['graphviz.py', '-v', 'mmdc', '-p', 'curl', '-r', 'Packages', '--follow', 'Depends,Recommends']
+        with patch.object(sys, 'argv', test_args):
+            self.assertEqual(parse_args().follow, ("Depends", "Recommends"))
+
+    def _analysis_graph(self):
+        # app -> lib1 <-> lib2 -> libc6, tool -> libc6, libc6 зависит сам от себя
+        graph = DependencyGraph()
+        graph.roots = [graph.add_node("app"), graph.add_node("tool")]
+        for parent, child in [("app", "lib1"), ("lib1", "lib2"), ("lib2", "lib1"),
+                              ("lib2", "libc6"), ("tool", "libc6"), ("libc6", "libc6")]:
+            graph.add_edge(parent, child)
+        return GraphAnalysis(graph)
+
+    def test_analysis_cycles(self):
+        cycles = self._analysis_graph().cycles()
+        self.assertEqual(sorted(sorted(cycle) for cycle in cycles), [["lib1", "lib2"], ["libc6"]])
+
+    def test_analysis_closure_sizes(self):
+        analysis = self._analysis_graph()
+        self.assertEqual(analysis.closure_size("app"), 3)
+        self.assertEqual(analysis.closure_size("lib1"), 2)  # lib2 и libc6; сам lib1 не считается
+        self.assertEqual(analysis.closure_size("tool"), 1)
+        self.assertEqual(analysis.largest_closures(2), [("app", 3), ("lib1", 2)])
+
+    def test_analysis_reverse_queries(self):
+        analysis = self._analysis_graph()
+        self.assertEqual(analysis.pulled_in_by("libc6"), ["app", "tool"])
+        self.assertEqual(analysis.pulled_in_by("lib2"), ["app"])
+        self.assertEqual({analysis.graph.names[node] for node in analysis.dependents("lib1")}, {"app", "lib2"})
+        with self.assertRaises(KeyError):
+            analysis.closure_size("missing")
+
+    def test_analysis_handles_deep_chains(self):
+        # Глубокая цепочка не должна упираться в предел рекурсии
+        graph = DependencyGraph()
+        graph.roots = [graph.add_node("p0")]
+        for number in range(20000):
+            graph.add_edge(f"p{number}", f"p{number + 1}")
+        analysis = GraphAnalysis(graph)
+        self.assertEqual(analysis.closure_size("p0"), 20000)
+        self.assertEqual(analysis.cycles(), [])
+        self.assertEqual(analysis.pulled_in_by("p20000"), ["p0"])
+
+    def test_render_state_roundtrip(self):
+        graph = DependencyGraph()
+        graph.add_edge("curl", "libcurl4")
+        graph.add_edge("curl", "ca-certificates", "Recommends")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "graph.mmd.state.json")
+
+        save_render_state(path, graph_digest(graph), graph)
+        digest, restored = load_render_state(path)
+        self.assertEqual(digest, graph_digest(graph))
+        self.assertEqual(to_mermaid(restored), to_mermaid(graph))
+        self.assertIsNone(load_render_state(os.path.join(directory.name, "missing.json")))
+
+    def test_changed_subgraph(self):
+        previous = DependencyGraph()
+        for parent, child in [("app", "lib1"), ("lib1", "libc6"), ("app", "old")]:
+            previous.add_edge(parent, child)
+        graph = DependencyGraph()
+        for parent, child in [("app", "lib1"), ("lib1", "libc6"), ("lib1", "libnew")]:
+            graph.add_edge(parent, child)
+
+        subgraph = changed_subgraph(previous, graph)
+        # Изменились lib1 (новое ребро), libnew (новый пакет) и app (пропало ребро к old)
+        self.assertEqual(sorted(subgraph.edges()), [("app", "lib1"), ("lib1", "libc6"), ("lib1", "libnew")])
+        self.assertEqual(changed_subgraph(graph, graph).edge_count, 0)
+
+    @patch('subprocess.run')
+    def test_main_skips_unchanged_graph(self, mock_run):
+        mock_run.return_value = MagicMock(stdout='', stderr='', returncode=0)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        with open("Packages", "w", encoding="utf-8") as file:
+            file.write("Package: curl\nDepends: libcurl4\n\nPackage: libcurl4\n")
+        argv = ['graphviz.py', '-v', 'mmdc', '-p', 'curl', '-r', 'Packages', '--no-cache']
+
+        def run(*extra):
+            mock_run.reset_mock()
+            with patch.object(sys, 'argv', argv + list(extra)), patch('sys.stdout', new_callable=StringIO):
+                main()
+            # Визуализатор «создаёт» картинку
+            open("graph.png", "w").close()
+            return [call.args[0] for call in mock_run.call_args_list]
+
+        full = [["mmdc", "-i", "graph.mmd", "-o", "graph.png"]]
+        self.assertEqual(run(), full)
+        self.assertEqual(run(), [])
+        self.assertEqual(run("--force"), full)
+
+        # Граф изменился: визуализируется только изменившийся подграф
+        with open("Packages", "a", encoding="utf-8") as file:
+            file.write("Depends: libc6\n")
+        self.assertEqual(run("--changed-only"), [["mmdc", "-i", "graph.changes.mmd", "-o", "graph.changes.png"]])
+        with open("graph.changes.mmd", encoding="utf-8") as file:
+            self.assertEqual(file.read(), "graph TD\n  curl --> libcurl4\n  libcurl4 --> libc6")
+        # graph.png после этого устарел: обычный запуск перерисовывает полный граф
+        self.assertEqual(run(), full)
+        self.assertEqual(run(), [])
+
     def test_parse_dependencies_empty(self):
         raw_dependencies = ""
         result = parse_dependencies(raw_dependencies)
@@ -1,6 +1,16 @@
 import argparse
+import ast
+import glob
+import hashlib
+import io
 import json
+import marshal
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from json.decoder import scanstring
+from json.scanner import NUMBER_RE
 
 
 def translate(json_data, constants=None, indent_level=0):
@@ -10,11 +20,12 @@ def translate(json_data, constants=None, indent_level=0):
     result = []
 
     if isinstance(json_data, dict):
+        # Константы вычисляются заранее, поэтому на них можно ссылаться до объявления
+        definitions = {key[4:].strip(): value for key, value in json_data.items() if key.startswith("def ")}
+        resolve_constants(definitions, constants)
         for key, value in json_data.items():
             if key.startswith("def "):
-                const_name = key[4:].strip()
-                constants[const_name] = int(value)
-                result.append(f"def {const_name} := {value}")
+                result.append(f"def {key[4:].strip()} := {value}")
             elif isinstance(value, dict):
                 result.append(f"{key} {handle_dictionaries(value, constants, indent_level)}")
             elif key == "комментарий":
@@ -51,8 +62,8 @@ def handle_value(value, constants, indent_level=0):
         return str(value)
     elif isinstance(value, str):
         # Обрабатываем выражение ^{имя_константы}
-        if value.startswith("^{"):
-            const_name = value[2:-1]  # Извлекаем имя константы
+        const_name = reference_name(value)
+        if const_name is not None:
             if const_name in constants:
                 return str(constants[const_name])  # Подставляем значение константы
             else:
@@ -71,31 +82,19 @@ def handle_dictionaries(data, constants, indent_level):
     :param indent_level: Уровень отступа для вложенных структур
     :return: Строка, представляющая словарь в учебном языке
     """
-    indent = "    " * indent_level
-    nested_indent = "    " * (indent_level + 1)
-    lines = ["$["]
-
-    items = list(data.items())
-
-    for i, (key, value) in enumerate(items):
-        if isinstance(value, dict):
-            # Рекурсивная обработка вложенного словаря
-            lines.append(f"{nested_indent}{key} {handle_dictionaries(value, constants, indent_level + 1)}")
-        else:
-            # Обычное ключ-значение
-            lines.append(f"{nested_indent}{key} : {handle_value(value, constants, indent_level + 1)}")
-
-        # Если это не последний элемент, добавляем запятую
-        if i < len(items) - 1:
-            lines[-1] += ","
-
-    lines.append(f"{indent}]")
-    return "\n".join(lines)
+    # Вложенные словари обходятся без рекурсии и пишутся в один общий буфер
+    buffer = io.StringIO()
+    ConfigEmitter(buffer, constants).write_block(data, indent_level)
+    return buffer.getvalue()
 
 # Функция для обработки объявления и вычисления констант
 def handle_definitions(data, constants, indent_level=0):
     result = []
     if isinstance(data, dict):
+        # Константы вычисляются заранее, поэтому на них можно ссылаться до объявления
+        definitions = dict(parse_constant(value) for value in data.values()
+                           if isinstance(value, str) and value.startswith("def"))
+        resolve_constants(definitions, constants)
         for key, value in data.items():
             if key == "комментарий":
                 # Обрабатываем комментарий отдельно
@@ -108,14 +107,80 @@ def handle_definitions(data, constants, indent_level=0):
                 result.append(f"{key} {handle_dictionaries(value, constants, indent_level)}")
             elif isinstance(value, str) and value.startswith("def"):
                 # Это объявление константы
-                const_name, const_value = value[4:].split(" := ")
-                constants[const_name.strip()] = const_value.strip()
-                result.append(f"def {const_name.strip()} := {const_value.strip()}")
+                result.append(handle_constant(value, constants))
             else:
                 result.append(f"{'    ' * indent_level}{key} = {handle_value(value, constants, indent_level)}")
     return "\n".join(result)
 
 
+# Функция для разбора объявления константы вида "def имя := значение"
+def parse_constant(value):
+    const_name, const_value = value[4:].split(" := ")
+    return const_name.strip(), const_value.strip()
+
+
+# Функция для обработки объявления константы: строка вывода, а если константа
+# ещё не вычислена заранее (однопроходный режим), то и её значение
+def handle_constant(value, constants):
+    const_name, const_value = parse_constant(value)
+    if const_name not in constants:
+        constants[const_name] = constant_text(const_value, constants)
+    return f"def {const_name} := {const_value}"
+
+
+# Функция для извлечения имени константы из ссылки ^{имя}
+def reference_name(value):
+    if isinstance(value, str) and value.startswith("^{"):
+        return value[2:-1]
+    return None
+
+
+# Значение константы при переводе в текст: ссылка заменяется текстом другой константы
+def constant_text(raw, constants):
+    const_name = reference_name(raw)
+    if const_name is None:
+        return raw
+    if const_name not in constants:
+        raise ValueError(f"Неизвестная константа: {const_name}")
+    return constants[const_name]
+
+
+def resolve_constants(definitions, constants=None, evaluate=constant_text):
+    """
+    Вычисляет константы независимо от порядка объявления.
+    Ссылки ^{имя} образуют граф зависимостей, который обходится в глубину без рекурсии
+    (в топологическом порядке), циклы обнаруживаются, каждое значение вычисляется один раз.
+
+    :param definitions: Словарь имя -> текст значения
+    :param constants: Словарь уже известных констант, дополняется результатом
+    :param evaluate: Функция (текст, константы) -> значение
+    :return: Словарь констант
+    """
+    if constants is None:
+        constants = {}
+    pending = {name: str(raw).strip() for name, raw in definitions.items()}
+    done = set()
+    for start in pending:
+        if start in done:
+            continue
+        path = [start]  # Текущая цепочка зависимостей
+        on_path = {start}
+        while path:
+            name = path[-1]
+            target = reference_name(pending[name])
+            if target in pending and target not in done:
+                if target in on_path:
+                    cycle = path[path.index(target):] + [target]
+                    raise ValueError(f"Циклическая зависимость констант: {' -> '.join(cycle)}")
+                path.append(target)
+                on_path.add(target)
+                continue
+            constants[name] = evaluate(pending[name], constants)
+            done.add(name)
+            on_path.discard(path.pop())
+    return constants
+
+
 # Главная функция для парсинга JSON и генерации конфигурационного текста
 def json_to_config(data):
     constants = {}
@@ -123,23 +188,630 @@ def json_to_config(data):
     return config_text
 
 
+# Литералы JSON, которые понимает json.load
+JSON_LITERALS = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "NaN": float("nan"),
+    "Infinity": float("inf"),
+    "-Infinity": float("-inf"),
+}
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonEventReader:
+    """
+    Потоковый разбор JSON: текст читается кусками, а наружу отдаются события
+    ("start_map" | "end_map" | "start_array" | "end_array" | "key" | "value", значение).
+    В памяти держится только текущий кусок и стек открытых скобок.
+    """
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=0):
+        # Дочитать следующий кусок, отбросив уже разобранный текст
+        if self.eof:
+            return False
+        chunk = self.stream.read(max(self.chunk_size, size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def _peek(self):
+        # Следующий значащий символ или "" в конце входа
+        while True:
+            buffer = self.buffer
+            self.pos = pos = JSON_WHITESPACE.match(buffer, self.pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char, message):
+        if self._peek() != char:
+            raise self._error(message)
+        self.pos += 1
+
+    def _string(self):
+        while True:
+            try:
+                value, self.pos = scanstring(self.buffer, self.pos + 1)
+                return value
+            except json.JSONDecodeError:
+                # Строка может обрываться на границе куска: буфер растёт вдвое
+                if not self._fill(len(self.buffer)):
+                    raise
+
+    def _scalar(self, char):
+        if char == '"':
+            return self._string()
+        while True:
+            # Число или литерал не должны обрываться на границе куска
+            if len(self.buffer) - self.pos < 16 and self._fill():
+                continue
+            match = NUMBER_RE.match(self.buffer, self.pos)
+            if match is not None and (match.end() < len(self.buffer) or not self._fill()):
+                integer, frac, exp = match.groups()
+                self.pos = match.end()
+                if frac or exp:
+                    return float(integer + (frac or "") + (exp or ""))
+                return int(integer)
+            if match is not None:
+                continue
+            for literal, value in JSON_LITERALS.items():
+                if self.buffer.startswith(literal, self.pos):
+                    self.pos += len(literal)
+                    return value
+            raise self._error("Expecting value")
+
+    def events(self):
+        stack = []  # Открытые контейнеры: "{" или "["
+        state = "value"
+        while True:
+            char = self._peek()
+            if state == "value":
+                if char == "{":
+                    self.pos += 1
+                    stack.append("{")
+                    yield "start_map", None
+                    state = "first_key"
+                elif char == "[":
+                    self.pos += 1
+                    stack.append("[")
+                    yield "start_array", None
+                    state = "first_value"
+                else:
+                    yield "value", self._scalar(char)
+                    state = "after_value"
+            elif state in ("first_key", "key"):
+                if state == "first_key" and char == "}":
+                    self.pos += 1
+                    stack.pop()
+                    yield "end_map", None
+                    state = "after_value"
+                    continue
+                if char != '"':
+                    raise self._error("Expecting property name enclosed in double quotes")
+                key = self._string()
+                self._expect(":", "Expecting ':' delimiter")
+                yield "key", key
+                state = "value"
+            elif state == "first_value":
+                if char == "]":
+                    self.pos += 1
+                    stack.pop()
+                    yield "end_array", None
+                    state = "after_value"
+                else:
+                    state = "value"
+            elif not stack:
+                if char:
+                    raise self._error("Extra data")
+                return
+            elif char == ",":
+                self.pos += 1
+                state = "key" if stack[-1] == "{" else "value"
+            elif char == "}" and stack[-1] == "{":
+                self.pos += 1
+                stack.pop()
+                yield "end_map", None
+            elif char == "]" and stack[-1] == "[":
+                self.pos += 1
+                stack.pop()
+                yield "end_array", None
+            else:
+                raise self._error("Expecting ',' delimiter")
+
+
+class ConfigEmitter:
+    """
+    Пишет конфигурацию по событиям JsonEventReader сразу в поток вывода.
+    Результат совпадает с json_to_config, а память ограничена глубиной вложенности:
+    стек хранит кадры [вид, число записанных элементов, уровень отступа].
+    """
+
+    TOP, BLOCK, LIST, MAPPING, SKIP = range(5)
+
+    def __init__(self, output, constants=None):
+        self.output = output
+        self.constants = {} if constants is None else constants
+        self.stack = []
+        self.key = None
+        self.first = True
+
+    def write_block(self, data, indent_level=0):
+        """
+        Записать словарь Python в виде $[ ... ]. Вместо рекурсии используется
+        стек итераторов по вложенным словарям.
+        """
+        self.output.write("$[")
+        self.stack.append([self.BLOCK, 0, indent_level])
+        iterators = [iter(data.items())]
+        while iterators:
+            for key, value in iterators[-1]:
+                self.key = key
+                if isinstance(value, dict):
+                    self.feed("start_map")
+                    iterators.append(iter(value.items()))
+                    break
+                self.feed("value", value)
+            else:
+                iterators.pop()
+                self.feed("end_map")
+
+    def _entry(self, text):
+        # Записи верхнего уровня разделяются переводом строки
+        self.output.write(text if self.first else "\n" + text)
+        self.first = False
+
+    def feed(self, event, value=None):
+        stack = self.stack
+        if event == "key":
+            frame = stack[-1]
+            if frame[0] == self.MAPPING:
+                self.output.write(f"{', ' if frame[1] else ''}{value!r}: ")
+                frame[1] += 1
+            else:
+                self.key = value
+        elif event in ("end_map", "end_array"):
+            kind, _, level = stack.pop()
+            if kind == self.BLOCK:
+                self.output.write(f"\n{'    ' * level}]")
+            elif kind == self.LIST:
+                self.output.write("]")
+            elif kind == self.MAPPING:
+                self.output.write("}")
+        elif not stack:
+            # Не-объект на верхнем уровне даёт пустую конфигурацию, как в json_to_config
+            if event == "start_map":
+                stack.append([self.TOP, 0, 0])
+            elif event == "start_array":
+                stack.append([self.SKIP, 0, 0])
+        else:
+            frame = stack[-1]
+            if frame[0] == self.TOP:
+                self._top_value(event, value)
+            elif frame[0] == self.BLOCK:
+                self._block_value(frame, event, value)
+            elif frame[0] == self.SKIP:
+                if event != "value":
+                    stack.append([self.SKIP, 0, 0])
+            else:
+                self._repr_value(frame, event, value)
+
+    def _top_value(self, event, value):
+        key = self.key
+        if key == "комментарий":
+            # Значение-комментарий выводится, всё остальное под этим ключом пропускается
+            if event == "value":
+                comment = handle_multiline_comments(value)
+                if comment:
+                    self._entry(comment)
+            else:
+                self.stack.append([self.SKIP, 0, 0])
+        elif event == "start_map":
+            self._entry(f"{key} $[")
+            self.stack.append([self.BLOCK, 0, 0])
+        elif event == "start_array":
+            self._entry(f"{key} = [")
+            self.stack.append([self.LIST, 0, 0])
+        elif isinstance(value, str) and value.startswith("def"):
+            self._entry(handle_constant(value, self.constants))
+        else:
+            self._entry(f"{key} = {handle_value(value, self.constants)}")
+
+    def _block_value(self, frame, event, value):
+        level = frame[2] + 1
+        self.output.write(f"{',' if frame[1] else ''}\n{'    ' * level}{self.key}")
+        frame[1] += 1
+        if event == "start_map":
+            self.output.write(" $[")
+            self.stack.append([self.BLOCK, 0, level])
+        elif event == "start_array":
+            self.output.write(" : [")
+            self.stack.append([self.LIST, 0, 0])
+        else:
+            self.output.write(f" : {handle_value(value, self.constants, level)}")
+
+    def _repr_value(self, frame, event, value):
+        # Списки выводятся как str(list) в handle_value, то есть в виде repr Python
+        if frame[0] == self.LIST:
+            if frame[1]:
+                self.output.write(", ")
+            frame[1] += 1
+        if event == "start_map":
+            self.output.write("{")
+            self.stack.append([self.MAPPING, 0, 0])
+        elif event == "start_array":
+            self.output.write("[")
+            self.stack.append([self.LIST, 0, 0])
+        else:
+            self.output.write(repr(value))
+
+
+def translate_stream(source, output, chunk_size=64 * 1024):
+    """
+    Потоково перевести JSON из source в конфигурационный язык, записывая текст в output.
+
+    :param source: Текстовый поток с JSON
+    :param output: Поток вывода (например, sys.stdout)
+    :return: Словарь объявленных констант
+    """
+    constants = {}
+    if source.seekable():
+        # Первый проход собирает объявления верхнего уровня, чтобы ссылки ^{имя}
+        # работали до объявления; если поток не перематывается, константы
+        # вычисляются по мере появления
+        start = source.tell()
+        resolve_constants(collect_definitions(source, chunk_size), constants)
+        source.seek(start)
+    emitter = ConfigEmitter(output, constants)
+    for event, value in JsonEventReader(source, chunk_size).events():
+        emitter.feed(event, value)
+    return emitter.constants
+
+
+def collect_definitions(source, chunk_size=64 * 1024):
+    """
+    Собрать объявления "def имя := значение" верхнего уровня из потока JSON.
+    """
+    definitions = {}
+    depth = 0
+    for event, value in JsonEventReader(source, chunk_size).events():
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+        elif event == "value" and depth == 1 and isinstance(value, str) and value.startswith("def"):
+            const_name, const_value = parse_constant(value)
+            definitions[const_name] = const_value
+    return definitions
+
+
+# Литералы значений, которые пишет handle_value через str()
+CONFIG_LITERALS = {"True": True, "False": False, "None": None}
+
+
+def parse_config_value(raw, constants):
+    """
+    Вычислить значение из текста: "строка", число, ^{константа}, True/False/None
+    или список/словарь в записи Python. Прочий текст возвращается как есть.
+    """
+    if len(raw) >= 2 and raw.startswith('"') and raw.endswith('"'):
+        return raw[1:-1]
+    if raw.startswith("^{") and raw.endswith("}"):
+        const_name = raw[2:-1]
+        if const_name not in constants:
+            raise ValueError(f"Неизвестная константа: {const_name}")
+        return constants[const_name]
+    if raw in CONFIG_LITERALS:
+        return CONFIG_LITERALS[raw]
+    for number_type in (int, float):
+        try:
+            return number_type(raw)
+        except ValueError:
+            pass
+    if raw[:1] in "[{(":
+        try:
+            return ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            pass
+    return raw
+
+
+def parse_config(text, constants=None):
+    """
+    Разобрать текст на конфигурационном языке в словарь Python.
+    Вложенные блоки $[ ... ] разбираются без рекурсии, константы def X := V
+    попадают в constants и подставляются вместо ^{X}, комментарии #| |# пропускаются.
+
+    :param text: Текст конфигурации
+    :param constants: Словарь констант (заполняется объявлениями из текста)
+    :return: Словарь с записями конфигурации
+    """
+    if constants is None:
+        constants = {}
+    lines = text.split("\n")
+    result = {}
+    stack = [result]  # Открытые блоки $[ ... ]
+    definitions = {}  # Объявления констант: на них можно ссылаться до объявления
+    references = []  # (блок, ключ, ссылка ^{имя}) для подстановки в конце разбора
+    index = 0
+
+    def error(message):
+        return ValueError(f"Строка {index}: {message}")
+
+    while index < len(lines):
+        line = lines[index].strip()
+        index += 1
+        in_block = len(stack) > 1
+        if not line:
+            continue
+        if line.startswith("#|"):
+            # Комментарий верхнего уровня: пропускаем до закрывающего |#
+            while not line.endswith("|#"):
+                if index >= len(lines):
+                    raise error("незакрытый комментарий #|")
+                line = lines[index].strip()
+                index += 1
+            continue
+        if line in ("]", "],"):
+            if not in_block:
+                raise error("лишняя закрывающая скобка ]")
+            stack.pop()
+            continue
+        # Значение берётся из исходной строки: пробелы в конце строковых значений значимы
+        key, separator, raw = lines[index - 1].lstrip().partition(" : " if in_block else " = ")
+        if line.endswith("$[") and not (separator and raw.startswith('"')):
+            block = stack[-1][line[:-2].rstrip()] = {}
+            stack.append(block)
+            continue
+        if not in_block and line.startswith("def ") and " := " in line:
+            const_name, const_value = line[4:].split(" := ", 1)
+            definitions[const_name.strip()] = const_value.strip()
+            continue
+        if not separator:
+            raise error(f"ожидалось '{'ключ : значение' if in_block else 'ключ = значение'}': {line}")
+        if raw.rstrip() == "#|" or in_block and raw.rstrip() == "#|,":
+            # Значение-комментарий занимает несколько строк до |#
+            inner = []
+            while True:
+                if index >= len(lines):
+                    raise error("незакрытый комментарий #|")
+                end = lines[index].strip()
+                index += 1
+                if end == "|#" or in_block and end == "|#,":
+                    break
+                inner.append(lines[index - 1])
+            stack[-1][key] = "#|\n" + "\n".join(inner) + "\n|#"
+            continue
+        if raw.startswith('"'):
+            # Строка с переводами строк продолжается до закрывающей кавычки. Кавычки внутри
+            # строк не экранируются, поэтому строка внутри значения не должна кончаться на "
+            while not (len(raw) >= 2 and raw.endswith('"') or in_block and len(raw) >= 3 and raw.endswith('",')):
+                if index >= len(lines):
+                    raise error("незакрытая строка")
+                raw += "\n" + lines[index]
+                index += 1
+        else:
+            raw = raw.rstrip()
+        if in_block and raw.endswith(","):
+            raw = raw[:-1]
+        if reference_name(raw) is not None:
+            # Ссылка подставляется после вычисления всех констант
+            references.append((stack[-1], key, raw))
+            stack[-1][key] = None
+        else:
+            stack[-1][key] = parse_config_value(raw, constants)
+
+    if len(stack) > 1:
+        raise error("незакрытый блок $[")
+    resolve_constants(definitions, constants, parse_config_value)
+    for block, key, raw in references:
+        block[key] = parse_config_value(raw, constants)
+    return result
+
+
+# Сигнатура файла с разобранной конфигурацией
+CONFIG_CACHE_MAGIC = b"CFGC0001"
+
+
+def load_config(path, use_cache=True):
+    """
+    Прочитать конфигурацию из файла. Разобранный словарь сохраняется рядом в path + ".cache"
+    (marshal) и используется повторно, пока не изменятся размер и время изменения файла.
+    """
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cache_path = path + ".cache"
+    if use_cache:
+        try:
+            with open(cache_path, "rb") as file:
+                if file.read(len(CONFIG_CACHE_MAGIC)) == CONFIG_CACHE_MAGIC:
+                    cached_key, data = marshal.load(file)
+                    if tuple(cached_key) == key:
+                        return data
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    with open(path, "r", encoding="utf-8") as file:
+        data = parse_config(file.read())
+
+    if use_cache:
+        # Кэш пишется атомарно; если каталог недоступен для записи, работаем без него
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(CONFIG_CACHE_MAGIC)
+                marshal.dump((key, data), file)
+            os.replace(tmp_path, cache_path)
+        except (OSError, ValueError):
+            pass
+    return data
+
+
+# Версия формата вывода: при изменении транслятора старые результаты в кэше недействительны
+BATCH_CACHE_FORMAT = 1
+# Файл с хешами исходных файлов в каталоге результатов пакетного режима
+BATCH_MANIFEST = ".confLang.cache.json"
+DEFAULT_JOBS = os.cpu_count() or 1
+
+
+def expand_sources(patterns):
+    """
+    Раскрыть каталоги (все *.json внутри) и шаблоны glob в отсортированный список файлов.
+    """
+    sources = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            sources.extend(glob.glob(os.path.join(pattern, "*.json")))
+        else:
+            sources.extend(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(set(sources))
+
+
+def file_digest(path):
+    # Хеш содержимого файла вместе с версией формата вывода
+    digest = hashlib.sha256(f"confLang:{BATCH_CACHE_FORMAT}:".encode("utf-8"))
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def translate_file(source, target):
+    """
+    Перевести один файл JSON в файл конфигурации (выполняется в процессе-обработчике).
+
+    :return: Текст ошибки или None
+    """
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(source, "r", encoding="utf-8") as file, open(tmp_path, "w", encoding="utf-8") as output:
+            translate_stream(file, output)
+            output.write("\n")
+        # Результат появляется атомарно, недописанный файл не попадёт в кэш
+        os.replace(tmp_path, target)
+        return None
+    except (OSError, ValueError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return str(e)
+
+
+def translate_batch(patterns, output_dir, jobs=DEFAULT_JOBS, force=False):
+    """
+    Перевести много файлов параллельно в нескольких процессах.
+    Файл пропускается, если хеш его содержимого совпадает с сохранённым в BATCH_MANIFEST
+    и результат на месте.
+
+    :param patterns: Каталоги или шаблоны glob с файлами JSON
+    :param output_dir: Каталог для файлов <имя>.conf
+    :param jobs: Число процессов
+    :param force: Переводить заново даже неизменившиеся файлы
+    :return: Словарь со списками translated, skipped и словарём failed (файл -> ошибка)
+    """
+    sources = expand_sources(patterns)
+    targets = {}
+    for source in sources:
+        target = os.path.join(output_dir, os.path.splitext(os.path.basename(source))[0] + ".conf")
+        if target in targets.values():
+            raise ValueError(f"Несколько файлов переводятся в один результат: {target}")
+        targets[source] = target
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    report = {"translated": [], "skipped": [], "failed": {}}
+    digests = {}
+    pending = []
+    for source in sources:
+        key = os.path.abspath(source)
+        digests[key] = file_digest(source)
+        if not force and manifest.get(key) == digests[key] and os.path.exists(targets[source]):
+            report["skipped"].append(source)
+        else:
+            pending.append(source)
+
+    if jobs > 1 and len(pending) > 1:
+        # Интерпретатор запускается один раз на процесс, а не на каждый файл
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            errors = list(executor.map(translate_file, pending, [targets[source] for source in pending]))
+    else:
+        errors = [translate_file(source, targets[source]) for source in pending]
+
+    for source, error in zip(pending, errors):
+        key = os.path.abspath(source)
+        if error is None:
+            manifest[key] = digests[key]
+            report["translated"].append(source)
+        else:
+            manifest.pop(key, None)
+            report["failed"][source] = error
+
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return report
+
+
 # Главная функция для работы с командной строкой
 def main():
     parser = argparse.ArgumentParser(description='Конвертирование JSON в конфигурационный язык.')
-    parser.add_argument('file', help='Путь к файлу JSON')
+    parser.add_argument('file', nargs='?', help='Путь к файлу JSON')
+    parser.add_argument('--parse', action='store_true',
+                        help='Обратное преобразование: разобрать файл на конфигурационном языке и вывести JSON')
+    # Пакетный режим
+    parser.add_argument('-b', '--batch', nargs='+', metavar='PATH',
+                        help='Каталоги или шаблоны glob с файлами JSON для пакетного перевода')
+    parser.add_argument('-o', '--output-dir', default="configs",
+                        help='Каталог для результатов пакетного режима (по умолчанию configs)')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'Число процессов пакетного режима (по умолчанию {DEFAULT_JOBS})')
+    parser.add_argument('--force', action='store_true',
+                        help='Переводить заново даже файлы, содержимое которых не изменилось')
 
     args = parser.parse_args()
+    if (args.file is None) == (args.batch is None):
+        parser.error("укажите либо файл, либо --batch")
 
     try:
-        # Чтение входного JSON файла
-        with open(args.file, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
+        if args.batch:
+            report = translate_batch(args.batch, args.output_dir, args.jobs, args.force)
+            for source, error in report["failed"].items():
+                print(f"Ошибка: {source}: {error}")
+            print(f"Переведено: {len(report['translated'])}, без изменений: {len(report['skipped'])}, "
+                  f"с ошибками: {len(report['failed'])}. Результаты в каталоге '{args.output_dir}'.")
+            if report["failed"]:
+                sys.exit(1)
+            return
 
-        # Преобразуем JSON в конфигурационный язык
-        config_text = json_to_config(json_data)
+        if args.parse:
+            print(json.dumps(load_config(args.file), ensure_ascii=False, indent=2))
+            return
 
-        # Выводим результат на стандартный вывод
-        print(config_text)
+        # Читаем JSON по кускам и сразу выводим результат на стандартный вывод
+        with open(args.file, 'r', encoding='utf-8') as f:
+            translate_stream(f, sys.stdout)
+        print()
 
     except FileNotFoundError:
         print(f"Ошибка: Файл {args.file} не найден.")
@@ -147,6 +819,10 @@ def main():
     except json.JSONDecodeError as e:
         print(f"Ошибка: Некорректный JSON в файле {args.file}. Ошибка: {e}")
         sys.exit(1)
+    except (ValueError, OSError) as e:
+        # Совпадающие имена результатов в пакетном режиме, неизвестные и циклические константы
+        print(f"Ошибка: {e}")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,11 @@
 import unittest
+import json
+from io import StringIO
 from confLang import handle_value, handle_dictionaries, translate  # Импорт функций из основной программы
+from confLang import json_to_config, translate_stream, parse_config, load_config, translate_batch, main
+import os
+import tempfile
+from unittest.mock import patch
 
 class TestConfLang(unittest.TestCase):
 
@@ -92,5 +98,197 @@ class TestConfLang(unittest.TestCase):
         result = translate(json_data, constants)
         self.assertEqual(result, expected_output)
 
+    def test_stream_matches_json_to_config(self):
+        # Потоковый перевод совпадает с json_to_config даже при разбиении на куски по 3 символа
+        json_data = {
+            "ключ1": "значение1",
+            "константа": "def число := 100",
+            "выражение": "^{число}",
+            "комментарий": "#|\nЭтот комментарий\n|#",
+            "список": [1, 2.5, "три", None, True, {"a": [1]}],
+            "словарь": {
+                "вложенный_ключ": "вложенное_значение",
+                "пустой": {},
+                "вложенный_словарь": {"глубокий_ключ": "^{число}", "массив": []}
+            }
+        }
+        text = json.dumps(json_data, ensure_ascii=False, indent=2)
+        output = StringIO()
+        constants = translate_stream(StringIO(text), output, chunk_size=3)
+        self.assertEqual(output.getvalue(), json_to_config(json_data))
+        self.assertEqual(constants, {"число": "100"})
+
+    def test_stream_deep_nesting(self):
+        # Глубина вложенности не ограничена стеком вызовов Python
+        depth = 1500
+        text = '{"корень": ' + '{"k": ' * depth + '1' + '}' * depth + '}'
+        output = StringIO()
+        translate_stream(StringIO(text), output)
+        lines = output.getvalue().split("\n")
+        self.assertEqual(lines[0], "корень $[")
+        self.assertEqual(lines[depth], "    " * depth + "k : 1")
+        self.assertEqual(lines[-1], "]")
+
+    def test_stream_invalid_json(self):
+        for text in ['{"a": 1,}', '{"a" 1}', '{"a": 1} лишнее', '']:
+            with self.assertRaises(json.JSONDecodeError):
+                translate_stream(StringIO(text), StringIO())
+
+    def test_dictionaries_without_recursion(self):
+        # Глубже предела рекурсии Python: вывод строится без рекурсивных вызовов
+        depth = 3000
+        json_data = value = {}
+        for _ in range(depth):
+            value["k"] = {}
+            value = value["k"]
+        value["лист"] = [1, {"a": "b"}]
+        lines = handle_dictionaries(json_data, {}, 0).split("\n")
+        self.assertEqual(len(lines), 2 * depth + 3)
+        self.assertEqual(lines[depth], "    " * depth + "k $[")
+        self.assertEqual(lines[depth + 1], "    " * (depth + 1) + "лист : [1, {'a': 'b'}]")
+        self.assertEqual(lines[-1], "]")
+
+    def test_dictionaries_indent_level_and_commas(self):
+        result = handle_dictionaries({"a": {}, "b": "^{x}", "c": {"d": 1}}, {"x": 5}, 1)
+        self.assertEqual(result, "$[\n        a $[\n        ],\n        b : 5,\n"
+                                 "        c $[\n            d : 1\n        ]\n    ]")
+
+    def test_parse_config(self):
+        text = (
+            'def число := 100\n'
+            '#|\nкомментарий\n|#\n'
+            'ключ1 = "значение1"\n'
+            'выражение = ^{число}\n'
+            'словарь $[\n'
+            '    ключ3 : "значение, с запятой",\n'
+            '    список : [1, \'a\'],\n'
+            '    вложенный_словарь $[\n'
+            '        ключ4 : 0.5,\n'
+            '        флаг : True\n'
+            '    ],\n'
+            '    ссылка : ^{число}\n'
+            ']'
+        )
+        constants = {}
+        result = parse_config(text, constants)
+        self.assertEqual(constants, {"число": 100})
+        self.assertEqual(result, {
+            "ключ1": "значение1",
+            "выражение": 100,
+            "словарь": {
+                "ключ3": "значение, с запятой",
+                "список": [1, "a"],
+                "вложенный_словарь": {"ключ4": 0.5, "флаг": True},
+                "ссылка": 100,
+            },
+        })
+
+    def test_parse_config_roundtrip(self):
+        # Текст, сгенерированный json_to_config, разбирается обратно в исходный словарь
+        json_data = {
+            "ключ": "строка\nв две строки ",
+            "словарь": {"пусто": {}, "комментарий": "#|\nтекст\n|#", "число": -7},
+            "список": [1, None],
+        }
+        self.assertEqual(parse_config(json_to_config(json_data)), json_data)
+
+    def test_parse_config_errors(self):
+        for text in ["ключ $[\n    a : 1", "]", "ключ без значения", "a = ^{нет}"]:
+            with self.assertRaises(ValueError):
+                parse_config(text)
+
+    def test_load_config_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "service.conf")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("ключ = 1\n")
+
+        self.assertEqual(load_config(path), {"ключ": 1})
+        self.assertTrue(os.path.exists(path + ".cache"))
+        # Повторная загрузка берёт разобранный словарь из кэша
+        with patch("confLang.parse_config") as parse:
+            self.assertEqual(load_config(path), {"ключ": 1})
+            parse.assert_not_called()
+
+        # Изменённый файл разбирается заново
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("ключ = 22\n")
+        self.assertEqual(load_config(path), {"ключ": 22})
+
+    def test_constants_forward_references(self):
+        # Ссылка на константу работает и до её объявления
+        self.assertEqual(translate({"a": "^{b}", "def b": 5}), "a = 5\ndef b := 5")
+        self.assertEqual(json_to_config({"a": "^{b}", "c": "def b := 7"}), "a = 7\ndef b := 7")
+        output = StringIO()
+        constants = translate_stream(StringIO('{"a": "^{b}", "c": "def b := ^{d}", "e": "def d := 3"}'), output)
+        self.assertEqual(output.getvalue().splitlines()[0], "a = 3")
+        self.assertEqual(constants, {"d": "3", "b": "3"})
+        self.assertEqual(parse_config("a = ^{b}\ndef b := ^{c}\ndef c := 2.5"), {"a": 2.5})
+
+    def test_constants_long_chain_and_cycles(self):
+        # Длинная цепочка, объявленная в обратном порядке, вычисляется без рекурсии
+        count = 5000
+        data = {f"c{i}": f"def k{i} := ^{{k{i + 1}}}" for i in range(count)}
+        data["last"] = f"def k{count} := 42"
+        data["value"] = "^{k0}"
+        self.assertTrue(json_to_config(data).endswith("value = 42"))
+
+        with self.assertRaises(ValueError) as error:
+            json_to_config({"a": "def x := ^{y}", "b": "def y := ^{x}"})
+        self.assertIn("x -> y -> x", str(error.exception))
+        with self.assertRaises(ValueError):
+            parse_config("def x := ^{x}")
+
+    def test_translate_batch(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        sources = os.path.join(directory.name, "json")
+        output_dir = os.path.join(directory.name, "out")
+        os.makedirs(sources)
+        data = {f"service{i}": {"порт": 8000 + i, "имя": f"service{i}"} for i in range(3)}
+        for name, value in data.items():
+            with open(os.path.join(sources, f"{name}.json"), "w", encoding="utf-8") as file:
+                json.dump(value, file, ensure_ascii=False)
+
+        # Несколько процессов: результат совпадает с json_to_config
+        report = translate_batch([sources], output_dir, jobs=2)
+        self.assertEqual(len(report["translated"]), 3)
+        for name, value in data.items():
+            with open(os.path.join(output_dir, f"{name}.conf"), encoding="utf-8") as file:
+                self.assertEqual(file.read(), json_to_config(value) + "\n")
+
+        # Неизменившиеся файлы пропускаются без перевода
+        with patch("confLang.translate_file") as translate_file:
+            report = translate_batch([os.path.join(sources, "*.json")], output_dir, jobs=1)
+            translate_file.assert_not_called()
+        self.assertEqual(len(report["skipped"]), 3)
+
+        # Изменённый файл переводится заново, ошибочный попадает в failed
+        with open(os.path.join(sources, "service0.json"), "w", encoding="utf-8") as file:
+            json.dump({"порт": 1}, file)
+        with open(os.path.join(sources, "broken.json"), "w", encoding="utf-8") as file:
+            file.write("{")
+        report = translate_batch([sources], output_dir, jobs=1)
+        self.assertEqual(report["translated"], [os.path.join(sources, "service0.json")])
+        self.assertEqual(list(report["failed"]), [os.path.join(sources, "broken.json")])
+        self.assertFalse(os.path.exists(os.path.join(output_dir, "broken.conf")))
+
+    def test_batch_cli_reports_errors(self):
+        # Два файла с одинаковым именем дают один результат: сообщение и код 1 вместо трассировки
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(directory.name, name))
+            with open(os.path.join(directory.name, name, "service.json"), "w", encoding="utf-8") as file:
+                file.write("{}")
+        argv = ["confLang.py", "-b", os.path.join(directory.name, "a"), os.path.join(directory.name, "b"),
+                "-o", os.path.join(directory.name, "out")]
+        with patch("sys.argv", argv), patch("sys.stdout", new_callable=StringIO) as stdout:
+            with self.assertRaises(SystemExit) as exit_info:
+                main()
+        self.assertEqual(exit_info.exception.code, 1)
+        self.assertIn("Ошибка: Несколько файлов переводятся в один результат", stdout.getvalue())
+
 if __name__ == "__main__":
     unittest.main()